@@ -1,31 +1,93 @@
 import os
 import json
-import random
-import io
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, render_template, redirect, url_for, flash
+import atexit
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from flask import Flask, request, jsonify, render_template, redirect, url_for, flash, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import defer, joinedload, object_session
 from flask_cors import CORS
-from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from PIL import Image
-from ultralytics import YOLO
-from models import db, User, Scan, SiteSetting
+from models import db, User, Scan, SiteSetting, scan_values
+import rollups
+from migrations import run_migrations
+from database import init_database, database_url, engine_options
+from inference import BatchScheduler
+from model_registry import ModelRegistry
+from jobs import JobQueue, QueueFull
+from preprocess import load_image
+from soil_profiles import get_soil_stats, generate_stats, profile_table
+from pagination import keyset_page
+from scan_export import EXPORT_FORMATS, export_select, stream_scans
+from uploads import Upload, UploadError, spool_upload, MAX_UPLOAD_BYTES
+from result_cache import ResultCache, perceptual_hash
+from passwords import PasswordHasher, RateLimiter, RateLimited, HasherBusy, BCRYPT_ROUNDS
+from identity_cache import IdentityCache
+from scan_writer import ScanWriter
+from site_cache import SiteCache
 
 app = Flask(__name__)
 
 # Config
 app.config['SECRET_KEY'] = 'soil-ai-super-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///soil_ai.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url() # DATABASE_URL=postgresql://... for larger deployments
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = 'jwt-secret-key-soil-ai'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)
+app.config['INFERENCE_BACKEND'] = os.environ.get('SOIL_AI_BACKEND', 'torch') # torch | onnx | onnx-int8 | openvino
+app.config['INFERENCE_THREADS'] = int(os.environ.get('SOIL_AI_INTRA_OP_THREADS', 0)) or None
+app.config['MODEL_LOAD_MODE'] = os.environ.get('SOIL_AI_MODEL_LOAD', 'eager') # lazy | eager | prefork
+app.config['MODEL_POLL_INTERVAL'] = float(os.environ.get('SOIL_AI_MODEL_POLL_INTERVAL', 5)) # 0 disables hot reload
+app.config['CANDIDATE_MODEL_PATH'] = os.environ.get('SOIL_AI_CANDIDATE_MODEL')
+app.config['CANDIDATE_PERCENT'] = float(os.environ.get('SOIL_AI_CANDIDATE_PERCENT', 0))
+app.config['INFERENCE_MAX_BATCH_SIZE'] = int(os.environ.get('SOIL_AI_MAX_BATCH_SIZE', 8))
+app.config['INFERENCE_MAX_WAIT_MS'] = float(os.environ.get('SOIL_AI_MAX_WAIT_MS', 10))
+app.config['BATCH_MAX_IMAGES'] = int(os.environ.get('SOIL_AI_BATCH_MAX_IMAGES', 500))
+app.config['MAX_UPLOAD_BYTES'] = MAX_UPLOAD_BYTES # per image
+app.config['MAX_BATCH_UPLOAD_BYTES'] = int(float(os.environ.get('SOIL_AI_MAX_BATCH_UPLOAD_MB', 2048)) * 1024 * 1024)
+# Hard cap on any request body; single-image endpoints get a tighter limit in check_content_length()
+app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_BATCH_UPLOAD_BYTES']
+app.config['BATCH_CHUNK_SIZE'] = int(os.environ.get('SOIL_AI_BATCH_CHUNK_SIZE', 32))
+app.config['DECODE_WORKERS'] = int(os.environ.get('SOIL_AI_DECODE_WORKERS', os.cpu_count() or 4))
+app.config['JOB_WORKERS'] = int(os.environ.get('SOIL_AI_JOB_WORKERS', 2))
+app.config['JOB_MAX_PENDING'] = int(os.environ.get('SOIL_AI_JOB_MAX_PENDING', 64))
+app.config['JOB_RESULT_TTL'] = int(os.environ.get('SOIL_AI_JOB_RESULT_TTL', 600))
+app.config['JOB_MAX_WAIT'] = 30
+app.config['JOB_DIR'] = os.environ.get('SOIL_AI_JOB_DIR', os.path.join(app.instance_path, 'jobs')) # shared by all workers
+app.config['JOB_STALE_AFTER'] = int(os.environ.get('SOIL_AI_JOB_STALE_AFTER', 300)) # running longer = its worker died
+app.config['ADMIN_PAGE_SIZE'] = 50
+app.config['ADMIN_MAX_PAGE_SIZE'] = 200
+app.config['HISTORY_PAGE_SIZE'] = int(os.environ.get('SOIL_AI_HISTORY_PAGE_SIZE', 50)) # /api/scans
+app.config['HISTORY_MAX_PAGE_SIZE'] = int(os.environ.get('SOIL_AI_HISTORY_MAX_PAGE_SIZE', 200))
+app.config['JOB_RETRY_AFTER'] = 5
+app.config['RESULT_CACHE_MAX_ENTRIES'] = int(os.environ.get('SOIL_AI_CACHE_MAX_ENTRIES', 10000))
+app.config['RESULT_CACHE_MAX_BYTES'] = int(os.environ.get('SOIL_AI_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+app.config['RESULT_CACHE_TTL'] = int(os.environ.get('SOIL_AI_CACHE_TTL', 3600))
+app.config['RESULT_CACHE_PHASH'] = os.environ.get('SOIL_AI_CACHE_PHASH', '0') == '1'
+app.config['BCRYPT_ROUNDS'] = BCRYPT_ROUNDS # existing hashes are upgraded on the next login
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('SOIL_AI_PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 4) // 4)))
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('SOIL_AI_PASSWORD_HASH_MAX_PENDING', 32))
+app.config['LOGIN_RATE_PER_IP'] = int(os.environ.get('SOIL_AI_LOGIN_RATE_PER_IP', 30)) # attempts per window, 0 disables
+app.config['LOGIN_RATE_PER_USER'] = int(os.environ.get('SOIL_AI_LOGIN_RATE_PER_USER', 10))
+app.config['LOGIN_RATE_WINDOW'] = int(os.environ.get('SOIL_AI_LOGIN_RATE_WINDOW', 60))
+app.config['LOGIN_RETRY_AFTER'] = 2
+app.config['SCAN_WRITE_BEHIND'] = os.environ.get('SOIL_AI_SCAN_WRITE_BEHIND', '1') == '1'
+app.config['SCAN_FLUSH_BATCH_SIZE'] = int(os.environ.get('SOIL_AI_SCAN_FLUSH_BATCH_SIZE', 100))
+app.config['SCAN_FLUSH_INTERVAL'] = float(os.environ.get('SOIL_AI_SCAN_FLUSH_INTERVAL', 0.5))
+app.config['SCAN_MAX_PENDING'] = int(os.environ.get('SOIL_AI_SCAN_MAX_PENDING', 10000))
+app.config['IDENTITY_CACHE_TTL'] = int(os.environ.get('SOIL_AI_IDENTITY_CACHE_TTL', 300))
+app.config['IDENTITY_CACHE_MAX_ENTRIES'] = int(os.environ.get('SOIL_AI_IDENTITY_CACHE_MAX_ENTRIES', 10000))
+app.config['SITE_CACHE'] = os.environ.get('SOIL_AI_SITE_CACHE', '1') == '1'
+app.config['SITE_CACHE_CHECK_INTERVAL'] = float(os.environ.get('SOIL_AI_SITE_CACHE_CHECK_INTERVAL', 1)) # seconds between version checks
+app.config['PLANS_MAX_AGE'] = int(os.environ.get('SOIL_AI_PLANS_MAX_AGE', 0)) # 0: browsers revalidate every time (a 304 when unchanged)
 
 # Extensions
 CORS(app)
-db.init_app(app)
-bcrypt = Bcrypt(app)
+init_database(app, db) # pool, busy timeout and SQLite WAL/pragmas, see database.py
 jwt = JWTManager(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'admin_login'
@@ -36,31 +98,135 @@ def load_user(user_id):
 
 # AI Model Load
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "soil_model.pt")
-try:
-    model = YOLO(MODEL_PATH)
-    print("AI Model loaded successfully in Flask.")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    model = None
+model_registry = ModelRegistry(
+    app.config['INFERENCE_BACKEND'],
+    MODEL_PATH,
+    candidate_path=app.config['CANDIDATE_MODEL_PATH'],
+    candidate_percent=app.config['CANDIDATE_PERCENT'],
+    threads=app.config['INFERENCE_THREADS'],
+    poll_interval=app.config['MODEL_POLL_INTERVAL']
+)
+model_registry.start(app.config['MODEL_LOAD_MODE'])
+
+# Micro-batching inference worker shared by all request threads
+scheduler = BatchScheduler(
+    lambda images: model_registry.primary.predict(images),
+    max_batch_size=app.config['INFERENCE_MAX_BATCH_SIZE'],
+    max_wait_ms=app.config['INFERENCE_MAX_WAIT_MS']
+)
+
+# Predictions for previously seen uploads, keyed per model version and dropped
+# whenever the primary model file changes
+result_cache = ResultCache(
+    model_registry.primary.handle.path,
+    max_entries=app.config['RESULT_CACHE_MAX_ENTRIES'],
+    max_bytes=app.config['RESULT_CACHE_MAX_BYTES'],
+    ttl=app.config['RESULT_CACHE_TTL'],
+    use_phash=app.config['RESULT_CACHE_PHASH']
+)
+
+# Pool used to decode uploads of the batch endpoint in parallel
+decode_pool = ThreadPoolExecutor(max_workers=app.config['DECODE_WORKERS'], thread_name_prefix="decode")
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Async scan jobs (see process_scan_job below), queued in the scan_job table so any
+# worker process can run or answer for a job and queued jobs survive restarts
+with app.app_context():
+    job_queue = JobQueue(
+        lambda path, params: process_scan_job(path, params),
+        db.engine,
+        app.config['JOB_DIR'],
+        workers=app.config['JOB_WORKERS'],
+        max_pending=app.config['JOB_MAX_PENDING'],
+        result_ttl=app.config['JOB_RESULT_TTL'],
+        stale_after=app.config['JOB_STALE_AFTER']
+    )
+
+# bcrypt runs on its own small pool so login spikes cannot starve inference
+password_hasher = PasswordHasher(
+    app.config['BCRYPT_ROUNDS'],
+    workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_pending=app.config['PASSWORD_HASH_MAX_PENDING']
+)
+login_ip_limiter = RateLimiter(app.config['LOGIN_RATE_PER_IP'], app.config['LOGIN_RATE_WINDOW'])
+login_user_limiter = RateLimiter(app.config['LOGIN_RATE_PER_USER'], app.config['LOGIN_RATE_WINDOW'])
+
+# JWT subject -> user id, so authenticated requests skip the user lookup. The epoch
+# file is shared with other processes on the same DB (other workers, reset_pwd.py).
+identity_cache = IdentityCache(
+    ttl=app.config['IDENTITY_CACHE_TTL'],
+    max_entries=app.config['IDENTITY_CACHE_MAX_ENTRIES'],
+    epoch_path=os.path.join(app.instance_path, 'identity.epoch')
+)
+
+# The mapper events run inside the flush, before the transaction commits; they only
+# flag the session, and the bump happens once the change is visible to other workers
+@event.listens_for(User, 'after_delete')
+def user_deleted(mapper, connection, target):
+    object_session(target).info['identity_changed'] = True
+
+@event.listens_for(User, 'after_update')
+def user_updated(mapper, connection, target):
+    attrs = db.inspect(target).attrs
+    if attrs.password_hash.history.has_changes() or attrs.username.history.has_changes():
+        object_session(target).info['identity_changed'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def bump_identity_cache(session):
+    if session.info.pop('identity_changed', False):
+        identity_cache.bump()
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_identity_change(session):
+    session.info.pop('identity_changed', None)
+
+# Pricing plans and site settings, reloaded only when an admin write bumps their version
+site_cache = SiteCache(
+    check_interval=app.config['SITE_CACHE_CHECK_INTERVAL'],
+    enabled=app.config['SITE_CACHE']
+)
+
+def current_user_id():
+    """Id of the JWT's user, or None; served from identity_cache without a query on a hit."""
+    username = get_jwt_identity()
+    if not username:
+        return None
+    uid = get_jwt().get('uid')
+    if uid is None: # token issued before the uid claim existed
+        return identity_cache.get(('name', username), lambda: db.session.query(User.id).filter_by(username=username).scalar())
+    # Confirms the user still exists (primary key lookup) only when the entry is missing or stale
+    return identity_cache.get(uid, lambda: db.session.query(User.id).filter_by(id=uid, username=username).scalar())
+
+def save_scans(rows):
+    """Insert scan rows (scan_values dicts with a created_at) and update the dashboard rollups in one transaction."""
+    db.session.bulk_insert_mappings(Scan, rows)
+    rollups.record_scans(db.session.connection(), rows)
+    db.session.commit()
+
+# Scan history rows are committed in batches by a background thread, off the request path
+def write_scans(rows):
+    with app.app_context():
+        save_scans([dict(row, created_at=datetime.fromisoformat(row['created_at'])) for row in rows])
+
+scan_writer = ScanWriter(
+    write_scans,
+    batch_size=app.config['SCAN_FLUSH_BATCH_SIZE'],
+    flush_interval=app.config['SCAN_FLUSH_INTERVAL'],
+    max_pending=app.config['SCAN_MAX_PENDING'],
+    spill_dir=app.instance_path
+)
+atexit.register(scan_writer.close)
 
 # Create DB & Admin User
 with app.app_context():
-    db.create_all()
-    
-    # Auto-migration for new columns
-    try:
-        with db.engine.connect() as conn:
-            conn.execute(db.text('ALTER TABLE pricing_plan ADD COLUMN discount VARCHAR(20)'))
-            conn.execute(db.text('ALTER TABLE pricing_plan ADD COLUMN description TEXT'))
-            db.session.commit()
-    except Exception:
-        pass # Columns already exist or other error handled
+    # Creates a new database or applies pending schema migrations (see migrations.py)
+    run_migrations(db.engine)
 
     if not User.query.filter_by(username='admin').first():
         admin = User(
             username='admin',
             email='admin@soilai.com',
-            password_hash=bcrypt.generate_password_hash('admin123').decode('utf-8'),
+            password_hash=password_hasher.hash('admin123'),
             role='admin'
         )
         db.session.add(admin)
@@ -79,41 +245,38 @@ with app.app_context():
     
     db.session.commit()
 
-# --- Helper for Soil Stats ---
-def get_soil_stats(soil_type, confidence):
-    # (Same logic as before, but return dict)
-    data = {
-        "Black Soil": {"type": "Black (Chernozem)", "texture": "Clayey / Heavy", "ph": (6.5, 7.8), "n": (45, 70), "p": (25, 45), "k": (50, 90), "om": (5, 9), "moisture": (15, 25), "water_retention": "High", "ec": (0.5, 1.2), "cec": "Low to Moderate", "micro": {"Boron": "0.5 ppm", "Iron": "4.5 ppm", "Zinc": "0.8 ppm", "Manganese": "12 ppm"}, "season": "Post-Monsoon (Rabi)", "temp": (20, 30), "drainage": "Slow", "compaction": "Moderate", "climate": "Semi-Arid / Temperate", "deficiencies": ["Zinc", "Nitrogen", "Boron"], "fertilizer": "Urea, Zinc Sulphate, and Borax", "crops": ["Cotton", "Wheat", "Linseed", "Tobacco", "Gram"]},
-        # ... shortening for space, will include all in real file ...
-    }
-    # Fallback to Yellow Soil logic if not found
-    stats = data.get(soil_type, {"type": "Yellow (Podzolic)", "texture": "Silty / Clay", "ph": (5.0, 6.5), "n": (20, 40), "p": (15, 30), "k": (30, 50), "om": (3, 5), "moisture": (12, 20), "water_retention": "Moderate", "ec": (0.3, 0.8), "cec": "Moderate", "micro": {"Boron": "0.4 ppm", "Iron": "5 ppm", "Zinc": "0.6 ppm", "Manganese": "10 ppm"}, "season": "Spring / Kharif", "temp": (18, 30), "drainage": "Moderate", "compaction": "High", "climate": "Humid Subtropical", "deficiencies": ["Iron", "Magnesium", "Calcium"], "fertilizer": "Chelated Iron, Magnesium Nitrate, and Gypsum", "crops": ["Paddy", "Citrus", "Soybeans", "Tea", "Cereals"]})
-    
-    return {
-        "confidence": f"{confidence:.1f}%",
-        "soil_type": stats["type"],
-        "texture": stats["texture"],
-        "ph_min": stats["ph"][0],
-        "ph_max": stats["ph"][1],
-        "nitrogen": f"{random.randint(stats['n'][0], stats['n'][1])} mg/kg",
-        "phosphorus": f"{random.randint(stats['p'][0], stats['p'][1])} mg/kg",
-        "potassium": f"{random.randint(stats['k'][0], stats['k'][1])} mg/kg",
-        "organic_matter": f"{random.uniform(stats['om'][0], stats['om'][1]):.1f}%",
-        "moisture": f"{random.randint(stats['moisture'][0], stats['moisture'][1])}%",
-        "water_retention": stats["water_retention"],
-        "salinity_ec": f"{random.uniform(stats['ec'][0], stats['ec'][1]):.2f} dS/m",
-        "cec": stats["cec"],
-        "micro_nutrients": stats["micro"],
-        "planting_season": stats["season"],
-        "optimal_temp": f"{stats['temp'][0]}°C - {stats['temp'][1]}°C",
-        "drainage_type": stats["drainage"],
-        "compaction_level": stats["compaction"],
-        "climate_zone": stats["climate"],
-        "possible_deficiencies": stats["deficiencies"],
-        "recommended_fertilizer": stats["fertilizer"],
-        "recommended_crops": stats["crops"],
-        "health_score": f"{random.randint(65, 98)}/100"
-    }
+# Scans buffered by a previous process that could not reach the database before it exited
+scan_writer.replay()
+
+# --- Upload limits ---
+BATCH_ENDPOINTS = ('analyze_batch',)
+
+@app.before_request
+def check_content_length():
+    # Reject oversized bodies from the Content-Length header, before any of it is read
+    length = request.content_length
+    if length is None or request.endpoint not in ('analyze', 'submit_analyze_job') + BATCH_ENDPOINTS:
+        return None
+    limit = app.config['MAX_BATCH_UPLOAD_BYTES'] if request.endpoint in BATCH_ENDPOINTS else app.config['MAX_UPLOAD_BYTES'] + 64 * 1024
+    if length > limit:
+        return jsonify({"detail": f"Upload too large (max {limit // (1024 * 1024)} MB)"}), 413
+    return None
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({"detail": "Upload too large"}), 413
+
+@app.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify({"detail": e.detail}), e.status_code
+
+@app.errorhandler(RateLimited)
+def rate_limited(e):
+    return jsonify({"detail": "Too many login attempts, please try again later"}), 429, {"Retry-After": str(e.retry_after)}
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    return jsonify({"detail": "Server busy, please retry"}), 503, {"Retry-After": str(app.config['LOGIN_RETRY_AFTER'])}
 
 # --- PUBLIC API ROUTES ---
 
@@ -126,7 +289,7 @@ def register():
     new_user = User(
         username=data['username'],
         email=data['email'],
-        password_hash=bcrypt.generate_password_hash(data['password']).decode('utf-8')
+        password_hash=password_hasher.hash(data['password'])
     )
     db.session.add(new_user)
     db.session.commit()
@@ -139,15 +302,17 @@ def login():
     password = request.form.get('password')
     
     print(f"Login attempt for: {login_id}")
-    
-    # Check if user exists by username OR email
-    user = User.query.filter((User.username == login_id) | (User.email == login_id)).first()
+    login_ip_limiter.hit(request.remote_addr)
+    login_user_limiter.hit(login_id)
+
+    user = find_login_user(login_id)
     
     if user:
         print(f"User found: {user.username}")
-        if bcrypt.check_password_hash(user.password_hash, password):
+        if check_password(user, password):
             print("Password match!")
-            access_token = create_access_token(identity=user.username)
+            login_user_limiter.reset(login_id)
+            access_token = create_access_token(identity=user.username, additional_claims={"uid": user.id})
             return jsonify(access_token=access_token)
         else:
             print("Password MISMATCH")
@@ -156,45 +321,306 @@ def login():
     
     return jsonify({"detail": "Invalid username or password"}), 401
 
+def find_login_user(login_id):
+    # Two lookups on the unique username/email indexes instead of one OR query
+    if not login_id:
+        return None
+    first, second = (User.email, User.username) if '@' in login_id else (User.username, User.email)
+    return User.query.filter(first == login_id).first() or User.query.filter(second == login_id).first()
+
+def check_password(user, password):
+    # Verifies on the password_hasher pool and upgrades the stored hash if the cost factor changed.
+    # A bulk update skips the mapper events: the same password rehashed must not flush every identity cache.
+    ok, new_hash = password_hasher.verify(password, user.password_hash)
+    if new_hash:
+        User.query.filter_by(id=user.id).update({User.password_hash: new_hash})
+        db.session.commit()
+    return ok
+
 @app.route('/api/analyze', methods=['POST'])
 @jwt_required(optional=True)
 def analyze():
-    current_user_name = get_jwt_identity()
-    user = User.query.filter_by(username=current_user_name).first() if current_user_name else None
+    user_id = current_user_id()
 
     if 'image' not in request.files:
         return jsonify({"detail": "No image uploaded"}), 400
     
-    file = request.files['image']
-    img = Image.open(io.BytesIO(file.read())).convert('RGB')
-    
-    if model:
-        results = model.predict(img)
-        class_name = results[0].names[results[0].probs.top1]
-        conf = float(results[0].probs.top1conf) * 100
-    else:
-        class_name = "Yellow Soil"
-        conf = 85.0
+    upload = spool_upload(request.files['image'].stream, app.config['MAX_UPLOAD_BYTES'])
+    analysis = run_analysis(upload, user_id)
+    return jsonify(analysis)
+
+def classify_upload(upload):
+    """Return (class_name, confidence %, model_version) for a validated upload, reusing cached predictions."""
+    slot = model_registry.route()
+    digest = f"{slot.version}:{upload.digest}"
+    prediction = result_cache.get(digest)
+    if prediction is not None:
+        return prediction + (slot.version,)
+
+    try:
+        img = load_image(upload.file)
+    except Exception as e:
+        raise UploadError("Invalid image") from e
+    phash = None
+    if result_cache.use_phash:
+        phash = f"{slot.version}:{perceptual_hash(img)}"
+        prediction = result_cache.get_by_phash(phash)
+    if prediction is None:
+        prediction = scheduler.predict(img, slot.predict)
+    result_cache.put(digest, prediction, phash)
+    return prediction + (slot.version,)
+
+def run_analysis(upload, user_id):
+    """Classify an uploaded image, record the Scan row (write-behind) and return the analysis dict."""
+    class_name, conf, version = classify_upload(upload)
         
     analysis = get_soil_stats(class_name, conf)
     
     # Save to history
-    new_scan = Scan(
-        user_id=user.id if user else None,
-        soil_type=class_name,
-        confidence=f"{conf:.1f}%",
-        result_data=json.dumps(analysis)
-    )
-    db.session.add(new_scan)
-    db.session.commit()
+    scan = scan_values(class_name, conf, analysis, version, user_id)
+    scan["created_at"] = datetime.utcnow().isoformat()
+    if app.config['SCAN_WRITE_BEHIND']:
+        scan_writer.record(scan)
+    else:
+        write_scans([scan])
     
-    return jsonify(analysis)
+    return analysis
 
-@app.route('/api/plans', methods=['GET'])
-def get_plans():
+def process_scan_job(path, params):
+    # Runs on a job worker thread (in whichever process claimed the job), outside of any request
+    upload = Upload(open(path, 'rb'), params["digest"], params["size"], params["kind"], owned=True)
+    try:
+        with app.app_context():
+            return run_analysis(upload, params["user_id"])
+    finally:
+        upload.close()
+
+@app.route('/api/analyze/jobs', methods=['POST'])
+@jwt_required(optional=True)
+def submit_analyze_job():
+    current_user_name = get_jwt_identity()
+    user_id = current_user_id()
+
+    if 'image' not in request.files:
+        return jsonify({"detail": "No image uploaded"}), 400
+
+    upload = spool_upload(request.files['image'].stream, app.config['MAX_UPLOAD_BYTES'])
+    params = {"user_id": user_id, "digest": upload.digest, "size": upload.size, "kind": upload.kind}
+    try:
+        # Streamed from the spooled upload into the job directory; the row stores only its path
+        job_id = job_queue.submit(upload.file, params, owner=current_user_name)
+    except QueueFull:
+        response = jsonify({"detail": "Analysis queue is full, please retry shortly"})
+        response.headers['Retry-After'] = str(app.config['JOB_RETRY_AFTER'])
+        return response, 503
+    finally:
+        upload.close()
+
+    response = jsonify({"job_id": job_id, "status": "queued"})
+    response.headers['Location'] = url_for('get_analyze_job', job_id=job_id)
+    return response, 202
+
+@app.route('/api/analyze/jobs/<job_id>', methods=['GET'])
+@jwt_required(optional=True)
+def get_analyze_job(job_id):
+    # ?wait=N long-polls for up to N seconds until the job finishes
+    wait = min(request.args.get('wait', 0, type=float), app.config['JOB_MAX_WAIT'])
+    job = job_queue.get(job_id, wait=max(wait, 0))
+    if job is None or (job["owner"] and job["owner"] != get_jwt_identity()):
+        return jsonify({"detail": "Job not found"}), 404
+
+    body = {"job_id": job["id"], "status": job["status"]}
+    if job["status"] == "done":
+        body["result"] = job["result"]
+    elif job["status"] == "failed":
+        body["detail"] = job["detail"]
+    return jsonify(body)
+
+def collect_batch_uploads(zf):
+    """Return (filename, open_stream) pairs for the multipart `images` fields and the entries of `zf`.
+
+    Nothing is read here; each stream is opened and validated when its chunk is processed.
+    """
+    uploads = [(f.filename, lambda f=f: f.stream) for f in request.files.getlist('images')]
+    if zf is not None:
+        for info in zf.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith('__MACOSX/') or not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if info.file_size > app.config['MAX_UPLOAD_BYTES']:
+                uploads.append((name, None))
+                continue
+            uploads.append((name, lambda info=info: zf.open(info)))
+    return uploads
+
+def open_batch_upload(item):
+    """Spool one batch entry; returns an Upload or an error message."""
+    _, opener = item
+    if opener is None:
+        return f"Image too large (max {app.config['MAX_UPLOAD_BYTES'] // (1024 * 1024)} MB)"
+    try:
+        return spool_upload(opener(), app.config['MAX_UPLOAD_BYTES'])
+    except UploadError as e:
+        return e.detail
+
+def decode_image(upload):
+    try:
+        return load_image(upload.file)
+    except Exception:
+        return None
+
+@app.route('/api/analyze/batch', methods=['POST'])
+@jwt_required(optional=True)
+def analyze_batch():
+    user_id = current_user_id()
+
+    archive = request.files.get('archive')
+    try:
+        zf = zipfile.ZipFile(archive.stream) if archive else None
+    except zipfile.BadZipFile:
+        return jsonify({"detail": "Invalid zip archive"}), 400
+    try:
+        return process_batch(collect_batch_uploads(zf), user_id)
+    finally:
+        if zf is not None:
+            zf.close()
+
+def process_batch(uploads, user_id):
+    if not uploads:
+        return jsonify({"detail": "No images uploaded"}), 400
+    if len(uploads) > app.config['BATCH_MAX_IMAGES']:
+        return jsonify({"detail": f"Too many images (max {app.config['BATCH_MAX_IMAGES']})"}), 413
+
+    results = []
+    scans = []
+    created_at = datetime.utcnow()
+    chunk_size = app.config['BATCH_CHUNK_SIZE']
+    # The whole upload is served by one model version so a farm visit is scored consistently
+    slot = model_registry.route()
+    # Work in chunks so only a bounded number of decoded images are held in memory
+    for start in range(0, len(uploads), chunk_size):
+        chunk = uploads[start:start + chunk_size]
+        opened = [open_batch_upload(item) for item in chunk]
+        errors = {i: u for i, u in enumerate(opened) if isinstance(u, str)}
+        digests = [None if i in errors else f"{slot.version}:{u.digest}" for i, u in enumerate(opened)]
+        predictions = [None if d is None else result_cache.get(d) for d in digests]
+        # Only decode and classify the uploads the cache could not answer
+        misses = [i for i, p in enumerate(predictions) if p is None and i not in errors]
+        images = list(decode_pool.map(decode_image, [opened[i] for i in misses]))
+        for u in opened:
+            if not isinstance(u, str):
+                u.close()
+        futures = {}
+        for i, img in zip(misses, images):
+            if img is None:
+                errors[i] = "Invalid image"
+                continue
+            phash = f"{slot.version}:{perceptual_hash(img)}" if result_cache.use_phash else None
+            cached = result_cache.get_by_phash(phash) if phash else None
+            futures[i] = (scheduler.submit(img, slot.predict) if cached is None else None, cached, phash)
+        for i, (future, cached, phash) in futures.items():
+            predictions[i] = future.result() if future is not None else cached
+            result_cache.put(digests[i], predictions[i], phash)
+
+        # One vectorized stats pass for every successfully classified image in the chunk
+        ok = [p for p in predictions if p is not None]
+        analyses = iter(generate_stats([p[0] for p in ok], [p[1] for p in ok]))
+        for i, ((filename, _), prediction) in enumerate(zip(chunk, predictions)):
+            if prediction is None:
+                results.append({"filename": filename, "status": "error", "detail": errors.get(i, "Invalid image")})
+                continue
+            class_name, conf = prediction
+            analysis = next(analyses)
+            results.append({"filename": filename, "status": "success", "analysis": analysis})
+            scans.append(dict(scan_values(class_name, conf, analysis, slot.version, user_id), created_at=created_at))
+
+    # Single bulk insert + commit for the whole upload
+    if scans:
+        save_scans(scans)
+
+    return jsonify({"count": len(results), "analyzed": len(scans), "results": results})
+
+# --- Scan history ---
+SCAN_FILTERS = ('soil_type', 'user', 'date_from', 'date_to')
+
+def scan_filters(keys=SCAN_FILTERS):
+    return {key: request.args.get(key, '').strip() for key in keys}
+
+def filter_scans(query, filters):
+    """Apply soil type / user / date range filters to a Scan query or select()."""
+    if filters.get('soil_type'):
+        query = query.filter(Scan.soil_type == filters['soil_type'])
+    user = filters.get('user', '')
+    if user.lower() == 'guest':
+        query = query.filter(Scan.user_id.is_(None))
+    elif user:
+        user_id = db.session.query(User.id).filter_by(username=user).scalar()
+        query = query.filter(Scan.user_id == user_id if user_id is not None else db.false())
+    date_from, date_to = parse_date(filters.get('date_from', '')), parse_date(filters.get('date_to', ''))
+    if date_from:
+        query = query.filter(Scan.created_at >= date_from)
+    if date_to:
+        query = query.filter(Scan.created_at < date_to + timedelta(days=1))
+    return query
+
+def scan_summary(scan):
+    return {
+        "id": scan.id,
+        "soil_type": scan.soil_type,
+        "confidence": scan.confidence,
+        "model_version": scan.model_version,
+        "nitrogen": scan.nitrogen,
+        "phosphorus": scan.phosphorus,
+        "potassium": scan.potassium,
+        "ph_min": scan.ph_min,
+        "ph_max": scan.ph_max,
+        "health_score": scan.health_score,
+        "created_at": scan.created_at.isoformat() if scan.created_at else None
+    }
+
+def export_response(stmt, fmt, name):
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    response = app.response_class(stream_with_context(stream_scans(stmt, fmt)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}.{extension}"'
+    return response
+
+@app.route('/api/scans', methods=['GET'])
+@jwt_required()
+def scan_history():
+    # Newest first, one keyset page at a time (?cursor=<next_cursor>); served by the (user_id, created_at) index
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"detail": "User not found"}), 401
+    filters = scan_filters(('soil_type', 'date_from', 'date_to'))
+    query = filter_scans(Scan.query.options(defer(Scan.result_data)).filter(Scan.user_id == user_id), filters)
+    scans, next_cursor = keyset_page(query, [Scan.created_at, Scan.id], request.args.get('cursor'), page_size('HISTORY'))
+    return jsonify({"scans": [scan_summary(s) for s in scans], "next_cursor": next_cursor})
+
+@app.route('/api/scans/<int:scan_id>', methods=['GET'])
+@jwt_required()
+def scan_detail(scan_id):
+    user_id = current_user_id()
+    scan = Scan.query.filter_by(id=scan_id, user_id=user_id).first() if user_id is not None else None
+    if scan is None:
+        return jsonify({"detail": "Scan not found"}), 404
+    return jsonify(dict(scan_summary(scan), analysis=json.loads(scan.result_data)))
+
+@app.route('/api/scans/export', methods=['GET'])
+@jwt_required()
+def export_scans():
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({"detail": "User not found"}), 401
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"detail": f"Unknown format (use {', '.join(EXPORT_FORMATS)})"}), 400
+    stmt = filter_scans(export_select(fmt).filter(Scan.user_id == user_id), scan_filters(('soil_type', 'date_from', 'date_to')))
+    return export_response(stmt, fmt, 'my-soil-scans')
+
+def load_plans():
     from models import PricingPlan
     plans = PricingPlan.query.order_by(PricingPlan.order).all()
-    return jsonify([{
+    return [{
         "id": p.id,
         "name": p.name,
         "price": p.price,
@@ -202,7 +628,43 @@ def get_plans():
         "description": p.description,
         "features": p.features,
         "is_featured": p.is_featured
-    } for p in plans])
+    } for p in plans]
+
+def load_settings():
+    return {s.key: s.value for s in SiteSetting.query.all()}
+
+@app.route('/api/plans', methods=['GET'])
+def get_plans():
+    plans = site_cache.get('plans', load_plans)
+    response = app.response_class(plans.body, mimetype='application/json')
+    response.set_etag(plans.etag)
+    if plans.version: # Unix time of the last change; 0 until plans are first edited
+        response.last_modified = datetime.fromtimestamp(plans.version, timezone.utc)
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config['PLANS_MAX_AGE']
+    # Turns the response into a bodiless 304 when If-None-Match / If-Modified-Since match
+    return response.make_conditional(request)
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify({
+        "inference": scheduler.metrics(),
+        "jobs": job_queue.metrics(),
+        "result_cache": result_cache.metrics(),
+        "passwords": dict(password_hasher.metrics(), rate_limited=login_ip_limiter.limited + login_user_limiter.limited),
+        "identity_cache": identity_cache.metrics(),
+        "scan_writer": scan_writer.metrics(),
+        "site_cache": site_cache.metrics()
+    })
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    info = model_registry.primary.handle.info()
+    return jsonify({
+        "status": "ok" if info["ready"] or not info["loaded"] else "degraded",
+        "model": info,
+        "models": model_registry.info()
+    })
 
 # --- ADMIN PANEL ROUTES (Using render_template) ---
 
@@ -215,8 +677,13 @@ def admin_login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
+        try:
+            login_ip_limiter.hit(request.remote_addr)
+        except RateLimited:
+            flash('Too many login attempts, please try again later', 'error')
+            return render_template('admin_login.html'), 429
         user = User.query.filter_by(username=username, role='admin').first()
-        if user and bcrypt.check_password_hash(user.password_hash, password):
+        if user and check_password(user, password):
             login_user(user)
             return redirect(url_for('admin_dashboard'))
         flash('Invalid admin credentials', 'error')
@@ -225,26 +692,82 @@ def admin_login():
 @app.route('/api/admin/dashboard')
 @login_required
 def admin_dashboard():
-    total_users = User.query.count()
-    total_scans = Scan.query.count()
-    recent_scans = Scan.query.order_by(Scan.created_at.desc()).limit(10).all()
+    # Totals and trends come from the rollup tables, never from counting scan rows
+    by_soil_type = rollups.soil_type_totals()
+    now = datetime.utcnow()
+    total_users = rollups.counter('users')
+    total_scans = sum(row[1] for row in by_soil_type)
+    # Owners come from the same query (one JOIN) instead of one lookup per row
+    recent_scans = (Scan.query.options(defer(Scan.result_data), joinedload(Scan.owner))
+                    .order_by(Scan.created_at.desc(), Scan.id.desc()).limit(10).all())
     return render_template('admin_dashboard.html', 
                            users=total_users, 
                            scans=total_scans, 
                            recent_scans=recent_scans,
+                           by_soil_type=by_soil_type,
+                           hourly=rollups.series('hour', now - timedelta(hours=23)),
+                           daily=rollups.series('day', now - timedelta(days=13)),
                            active_page='dashboard')
 
 @app.route('/api/admin/users')
 @login_required
 def admin_users():
-    all_users = User.query.all()
-    return render_template('admin_users.html', users=all_users, active_page='users')
+    filters = {key: request.args.get(key, '').strip() for key in ('q', 'role')}
+    query = User.query
+    if filters['q']:
+        # Prefix range on the unique username index (LIKE 'q%' would not use it on SQLite)
+        query = query.filter(User.username >= filters['q'], User.username < filters['q'] + '\uffff')
+    if filters['role']:
+        query = query.filter(User.role == filters['role'])
+    users, next_cursor = keyset_page(query, [User.id], request.args.get('cursor'), page_size(), descending=False)
+    return render_template('admin_users.html', users=users, filters=filters, active_page='users',
+                           next_url=next_page_url('admin_users', next_cursor, filters))
 
 @app.route('/api/admin/scans')
 @login_required
 def admin_scans():
-    all_scans = Scan.query.order_by(Scan.created_at.desc()).all()
-    return render_template('admin_scans.html', scans=all_scans, active_page='scans')
+    filters = scan_filters()
+    # result_data is only fetched when a row is expanded (admin_scan_result)
+    query = filter_scans(Scan.query.options(defer(Scan.result_data), joinedload(Scan.owner)), filters)
+    scans, next_cursor = keyset_page(query, [Scan.created_at, Scan.id], request.args.get('cursor'), page_size())
+    return render_template('admin_scans.html', scans=scans, filters=filters, soil_types=profile_table.classes,
+                           active_page='scans', next_url=next_page_url('admin_scans', next_cursor, filters),
+                           export_args={key: value for key, value in filters.items() if value})
+
+@app.route('/api/admin/scans/export')
+@login_required
+def admin_export_scans():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"detail": f"Unknown format (use {', '.join(EXPORT_FORMATS)})"}), 400
+    return export_response(filter_scans(export_select(fmt), scan_filters()), fmt, 'soil-ai-scans')
+
+@app.route('/api/admin/scans/<int:scan_id>/result')
+@login_required
+def admin_scan_result(scan_id):
+    result_data = db.session.query(Scan.result_data).filter_by(id=scan_id).scalar()
+    if result_data is None:
+        return jsonify({"detail": "Scan not found"}), 404
+    return app.response_class(result_data, mimetype='application/json')
+
+def next_page_url(endpoint, cursor, filters):
+    if cursor is None:
+        return None
+    args = {key: value for key, value in filters.items() if value}
+    if 'per_page' in request.args:
+        args['per_page'] = page_size()
+    return url_for(endpoint, cursor=cursor, **args)
+
+def page_size(kind='ADMIN'):
+    # ?per_page clamped to the <kind>_PAGE_SIZE / <kind>_MAX_PAGE_SIZE settings
+    per_page = request.args.get('per_page', app.config[f'{kind}_PAGE_SIZE'], type=int)
+    return min(max(per_page, 1), app.config[f'{kind}_MAX_PAGE_SIZE'])
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return None
 
 @app.route('/api/admin/plans', methods=['GET', 'POST'])
 @login_required
@@ -272,21 +795,11 @@ def admin_plans():
             )
             db.session.add(plan)
         db.session.commit()
+        site_cache.invalidate('plans')
         flash('Plan updated successfully', 'success')
         return redirect(url_for('admin_plans'))
     
-    all_plans = PricingPlan.query.order_by(PricingPlan.order).all()
-    plans_list = []
-    for p in all_plans:
-        plans_list.append({
-            "id": p.id,
-            "name": p.name,
-            "price": p.price,
-            "discount": p.discount,
-            "description": p.description,
-            "features": p.features,
-            "is_featured": p.is_featured
-        })
+    plans_list = site_cache.get('plans', load_plans).value
     return render_template('admin_plans.html', plans=plans_list, active_page='plans')
 
 @app.route('/api/admin/settings', methods=['GET', 'POST'])
@@ -301,9 +814,10 @@ def admin_settings():
             else:
                 db.session.add(SiteSetting(key=key, value=value))
         db.session.commit()
+        site_cache.invalidate('settings')
         flash('Settings saved', 'success')
     
-    settings = {s.key: s.value for s in SiteSetting.query.all()}
+    settings = site_cache.get('settings', load_settings).value
     return render_template('admin_settings.html', settings=settings, active_page='settings')
 
 @app.route('/api/admin/logout')
@@ -312,4 +826,5 @@ def admin_logout():
     return redirect(url_for('admin_login'))
 
 if __name__ == '__main__':
+    job_queue.start()
     app.run(host='0.0.0.0', port=8000)
@@ -0,0 +1,119 @@
+"""
+Compare the old full-resolution decode against preprocess.load_image.
+
+Usage:
+  python benchmarks/bench_decode.py [folder_of_jpegs] [--repeat N]
+
+Without a folder, a corpus of synthetic 12 MP JPEGs is generated in a temp dir.
+Each method runs in its own process so peak RSS (VmHWM) is measured separately.
+"""
+import os
+import sys
+import time
+import glob
+import argparse
+import resource
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from preprocess import load_image, MODEL_INPUT_SIZE
+
+
+def decode_old(path):
+    with open(path, 'rb') as f:
+        return Image.open(f).convert('RGB')
+
+
+def decode_new(path):
+    with open(path, 'rb') as f:
+        return load_image(f)
+
+
+METHODS = {"old (full decode + convert)": decode_old, f"new (draft + resize to {MODEL_INPUT_SIZE})": decode_new}
+
+
+def peak_rss_mb():
+    # VmHWM is reset on exec, unlike ru_maxrss which the child inherits from the parent
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_corpus(folder, count=8, size=(4032, 3024)):
+    # Textured noise tinted like soil, roughly the file size of a 12 MP phone photo
+    import random
+    for i in range(count):
+        base = Image.effect_noise(size, 24).convert('RGB')
+        tint = Image.new('RGB', size, (random.randint(60, 160), random.randint(40, 110), random.randint(20, 70)))
+        Image.blend(base, tint, 0.6).save(os.path.join(folder, f"soil_{i}.jpg"), quality=90)
+
+
+def run(name, paths, repeat, out):
+    fn = METHODS[name]
+    fn(paths[0])  # warm up codecs
+    timings = []
+    for _ in range(repeat):
+        for p in paths:
+            t0 = time.perf_counter()
+            img = fn(p)
+            timings.append(time.perf_counter() - t0)
+            del img
+    timings.sort()
+    out.put({
+        "name": name,
+        "mean_ms": sum(timings) / len(timings) * 1000,
+        "p50_ms": timings[len(timings) // 2] * 1000,
+        "max_ms": timings[-1] * 1000,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder", nargs="?")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = None
+    folder = args.folder
+    if not folder:
+        tmp = tempfile.TemporaryDirectory()
+        folder = tmp.name
+        print("Generating synthetic 12 MP corpus...")
+        make_corpus(folder)
+
+    paths = sorted(glob.glob(os.path.join(folder, "*.jpg")) + glob.glob(os.path.join(folder, "*.jpeg")))
+    if not paths:
+        print(f"No JPEGs found in {folder}")
+        sys.exit(1)
+    print(f"Decoding {len(paths)} images x {args.repeat}")
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for name in METHODS:
+        out = ctx.Queue()
+        proc = ctx.Process(target=run, args=(name, paths, args.repeat, out))
+        proc.start()
+        results.append(out.get())
+        proc.join()
+
+    print(f"{'method':<34}{'mean ms':>10}{'p50 ms':>10}{'max ms':>10}{'peak RSS MB':>14}")
+    for r in results:
+        print(f"{r['name']:<34}{r['mean_ms']:>10.1f}{r['p50_ms']:>10.1f}{r['max_ms']:>10.1f}{r['peak_rss_mb']:>14.1f}")
+    old, new = results
+    print(f"Speedup: {old['mean_ms'] / new['mean_ms']:.1f}x")
+
+    if tmp:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
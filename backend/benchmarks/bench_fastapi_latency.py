@@ -0,0 +1,105 @@
+"""
+Latency of cheap FastAPI endpoints while /analyze is saturated.
+
+Usage:
+  uvicorn main:app --port 8000          # in another shell, from backend/
+  python benchmarks/bench_fastapi_latency.py --url http://localhost:8000 [--analyze-clients 16] [--samples 200]
+
+Measures p50/p99 of /health and /token first on an idle server, then while
+--analyze-clients concurrent clients keep POSTing images to /analyze.
+Run it against the old and new main.py to compare.
+"""
+import io
+import time
+import uuid
+import argparse
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import json
+
+from PIL import Image
+
+
+def request(url, data=None, headers=None, method=None):
+    req = urllib.request.Request(url, data=data, headers=headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=120) as r:
+            return r.status, r.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000
+
+
+def measure(name, fn, samples):
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    print(f"  {name:<8} p50 {percentile(timings, 50):8.1f} ms   p99 {percentile(timings, 99):8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--analyze-clients", type=int, default=16)
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+
+    username = f"bench_{uuid.uuid4().hex[:8]}"
+    request(args.url + "/register", json.dumps({"username": username, "email": f"{username}@bench.local", "password": "bench-pass"}).encode(),
+            {"Content-Type": "application/json"})
+    form = urllib.parse.urlencode({"username": username, "password": "bench-pass"}).encode()
+    form_headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    _, body = request(args.url + "/token", form, form_headers)
+    token = json.loads(body)["access_token"]
+
+    buf = io.BytesIO()
+    Image.effect_noise((3000, 2000), 32).convert("RGB").save(buf, "JPEG", quality=90)
+    boundary = uuid.uuid4().hex
+    upload = (f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="soil.jpg"\r\n'
+              f'Content-Type: image/jpeg\r\n\r\n').encode() + buf.getvalue() + f'\r\n--{boundary}--\r\n'.encode()
+    upload_headers = {"Content-Type": f"multipart/form-data; boundary={boundary}", "Authorization": f"Bearer {token}"}
+
+    probes = {
+        "/health": lambda: request(args.url + "/health"),
+        "/token": lambda: request(args.url + "/token", form, form_headers),
+    }
+
+    print("Idle server:")
+    for name, fn in probes.items():
+        measure(name, fn, args.samples)
+
+    stop = threading.Event()
+    codes = {}
+    lock = threading.Lock()
+
+    def hammer():
+        while not stop.is_set():
+            code, _ = request(args.url + "/analyze", upload, upload_headers, "POST")
+            with lock:
+                codes[code] = codes.get(code, 0) + 1
+
+    clients = [threading.Thread(target=hammer, daemon=True) for _ in range(args.analyze_clients)]
+    for t in clients:
+        t.start()
+    time.sleep(2)  # let the analyze backlog build up
+
+    print(f"With {args.analyze_clients} clients saturating /analyze:")
+    for name, fn in probes.items():
+        measure(name, fn, args.samples)
+
+    stop.set()
+    for t in clients:
+        t.join()
+    print(f"/analyze status codes during the run: {codes}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Logins per second per core for the bcrypt cost factors you are considering.
+
+Usage:
+  python benchmarks/bench_login.py [--rounds 10 11 12 13] [--workers 1 2 4] [--logins 64]
+  python benchmarks/bench_login.py --url http://localhost:5000/api/token --username admin --password admin123 [--concurrency 16]
+
+The first form times passwords.PasswordHasher.verify in-process for every
+rounds x workers combination. The second drives a running server's token
+endpoint (Flask /api/token or FastAPI /token) and reports the status codes,
+so you can see 429/503 shedding kick in. Set SOIL_AI_LOGIN_RATE_PER_IP=0
+and SOIL_AI_LOGIN_RATE_PER_USER=0 on the server to measure raw throughput.
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from passwords import PasswordHasher
+
+
+def bench_hasher(rounds, workers, logins):
+    hasher = PasswordHasher(rounds, workers=workers, max_pending=logins)
+    hashed = hasher.hash("bench-password")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=logins) as clients:
+        results = list(clients.map(lambda _: hasher.verify("bench-password", hashed), range(logins)))
+    elapsed = time.perf_counter() - started
+    assert all(ok for ok, _ in results)
+    rate = logins / elapsed
+    print(f"  rounds {rounds:>2}  workers {workers:>2}   {elapsed / logins * workers * 1000:7.1f} ms/login   "
+          f"{rate:8.1f} logins/s   {rate / min(workers, os.cpu_count() or 1):8.1f} logins/s/core")
+
+
+def bench_server(url, username, password, concurrency, logins):
+    form = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    codes = {}
+    lock = threading.Lock()
+
+    def login(_):
+        req = urllib.request.Request(url, data=form, headers={"Content-Type": "application/x-www-form-urlencoded"})
+        try:
+            with urllib.request.urlopen(req, timeout=60) as r:
+                code = r.status
+        except urllib.error.HTTPError as e:
+            code = e.code
+        with lock:
+            codes[code] = codes.get(code, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as clients:
+        list(clients.map(login, range(logins)))
+    elapsed = time.perf_counter() - started
+    print(f"{logins} logins, concurrency {concurrency}: {elapsed:.2f}s, {codes.get(200, 0) / elapsed:.1f} successful logins/s")
+    print(f"Status codes: {codes}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--url")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    if args.url:
+        bench_server(args.url, args.username, args.password, args.concurrency, args.logins)
+        return
+
+    print(f"{os.cpu_count()} CPUs, {args.logins} concurrent logins per run")
+    for rounds in args.rounds:
+        for workers in sorted(set(args.workers)):
+            bench_hasher(rounds, workers, args.logins)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+/api/plans throughput: uncached vs site_cache vs conditional (304) requests.
+
+Usage:
+  python benchmarks/bench_plans.py [--requests 5000] [--threads 4]
+  python benchmarks/bench_plans.py --url http://localhost:5000/api/plans [--requests 5000] [--threads 16]
+
+The first form runs the Flask app in-process with the test client against a
+fresh SQLite database in a temp dir (the model is loaded lazily and never used),
+toggling app.site_cache between rounds. The second drives a running server;
+start it with SOIL_AI_SITE_CACHE=0 and then =1 to compare. "revalidate" sends
+the ETag from the first response back in If-None-Match, as a browser does.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run(label, fetch, requests, threads):
+    codes = {}
+    lock = threading.Lock()
+
+    def one(_):
+        code = fetch()
+        with lock:
+            codes[code] = codes.get(code, 0) + 1
+
+    fetch() # warm up (fills the cache when enabled)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as clients:
+        list(clients.map(one, range(requests)))
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<12} {requests / elapsed:9.0f} req/s   {elapsed / requests * 1e6:8.1f} us/req   {codes}")
+
+
+def bench_in_process(requests, threads):
+    tmp = tempfile.mkdtemp(prefix="soil_bench_")
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmp, 'bench.db')
+    os.environ.setdefault('SOIL_AI_MODEL_LOAD', 'lazy')
+    from app import app, site_cache
+
+    client = app.test_client()
+    etag = client.get('/api/plans').headers['ETag']
+
+    def plain():
+        return client.get('/api/plans').status_code
+
+    def revalidate():
+        return client.get('/api/plans', headers={'If-None-Match': etag}).status_code
+
+    for enabled in (False, True):
+        site_cache.enabled = enabled
+        site_cache.invalidate()
+        print("site_cache on" if enabled else "site_cache off")
+        run("plain", plain, requests, threads)
+        run("revalidate", revalidate, requests, threads)
+    print(site_cache.metrics())
+
+
+def bench_server(url, requests, threads):
+    def get(headers):
+        req = urllib.request.Request(url, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=30) as r:
+                r.read()
+                return r.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    with urllib.request.urlopen(url, timeout=30) as r:
+        etag = r.headers.get('ETag')
+    print(url)
+    run("plain", lambda: get({}), requests, threads)
+    if etag:
+        run("revalidate", lambda: get({'If-None-Match': etag}), requests, threads)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    if args.url:
+        bench_server(args.url, args.requests, args.threads)
+    else:
+        bench_in_process(args.requests, args.threads)
@@ -0,0 +1,112 @@
+"""
+Load test: many concurrent ~20 MB uploads against a running server, sampling its RSS.
+
+Usage:
+  python benchmarks/load_uploads.py --url http://localhost:8000 [--concurrency 32] [--requests 128]
+  python benchmarks/load_uploads.py --url http://localhost:8000 --endpoint /analyze --health /health --token <jwt>
+
+The upload is a small valid JPEG padded to --size-mb (decoders ignore bytes after the
+end-of-image marker), so the run measures the upload path rather than decoding.
+Worker RSS is read from the health endpoint, so run the server with a single worker.
+"""
+import io
+import sys
+import time
+import json
+import uuid
+import argparse
+import threading
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+
+def make_payload(size_mb):
+    buf = io.BytesIO()
+    Image.new('RGB', (640, 480), (120, 90, 60)).save(buf, 'JPEG')
+    data = buf.getvalue()
+    return data + b'\0' * max(0, int(size_mb * 1024 * 1024) - len(data))
+
+
+def multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode()
+    return head + data + f'\r\n--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+
+def fetch_rss(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as r:
+            return json.load(r)["model"]["rss_mb"]
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/api/analyze")
+    parser.add_argument("--health", default="/api/health")
+    parser.add_argument("--token")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--size-mb", type=float, default=19.5)
+    args = parser.parse_args()
+
+    body, content_type = multipart("image", "field.jpg", make_payload(args.size_mb))
+    headers = {"Content-Type": content_type}
+    if args.token:
+        headers["Authorization"] = f"Bearer {args.token}"
+
+    health_url = args.url + args.health
+    baseline = fetch_rss(health_url)
+    if baseline is None:
+        print(f"Could not read RSS from {health_url}")
+        sys.exit(1)
+
+    samples = []
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            rss = fetch_rss(health_url)
+            if rss is not None:
+                samples.append(rss)
+            time.sleep(0.1)
+
+    statuses = {}
+    lock = threading.Lock()
+
+    def send(_):
+        req = urllib.request.Request(args.url + args.endpoint, data=body, headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=300) as r:
+                code = r.status
+        except urllib.error.HTTPError as e:
+            code = e.code
+        except Exception as e:
+            code = type(e).__name__
+        with lock:
+            statuses[code] = statuses.get(code, 0) + 1
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(send, range(args.requests)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    sampler.join()
+
+    peak = max(samples) if samples else baseline
+    print(f"{args.requests} uploads of {len(body) / 1024 / 1024:.1f} MB, concurrency {args.concurrency}, {elapsed:.1f}s")
+    print(f"Status codes: {statuses}")
+    print(f"Worker RSS: baseline {baseline:.1f} MB, peak {peak:.1f} MB (+{peak - baseline:.1f} MB)")
+    print(f"Unbounded buffering would need ~{args.concurrency * len(body) / 1024 / 1024:.0f} MB for the in-flight bodies alone")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Builds the train/val classification dataset from the raw soil photos without copying them.
+
+  python dataset_builder.py [--seed 0] [--val-fraction 0.2] [--link hardlink|symlink|copy]
+
+RAW_DATA_DIR/<class>/<image> becomes DATASET_DIR/{train,val}/<class>/<image>, as
+hardlinks by default (no extra disk space; falls back to symlinks across filesystems),
+which is the folder layout the YOLO classifier trains on. DATASET_DIR/manifest.json
+records every raw file's size, mtime, SHA-256 and split, so a rebuild only hashes new
+or modified files and only touches links whose image or split changed.
+
+The split is stratified and reproducible: within each class, images are ordered by a
+hash of the seed and their content and the first `val_fraction` go to val, so the same
+corpus and seed always give the same split, whatever order the files are listed in.
+Exact duplicates are left out and near-duplicate groups stay on one side of the split
+(dedup.py); counts are in the summary and the groups in DATASET_DIR/dedup_report.json.
+"""
+import os
+import json
+import shutil
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from dedup import deduplicate
+
+MANIFEST_NAME = "manifest.json"
+DEDUP_REPORT_NAME = "dedup_report.json"
+MANIFEST_VERSION = 1
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+SPLITS = ('train', 'val')
+LINK_MODES = ('hardlink', 'symlink', 'copy')
+HASH_CHUNK = 1024 * 1024
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def list_raw_images(raw_dir):
+    """{relative path: (class, size, mtime_ns)} for every image under raw_dir/<class>/."""
+    found = {}
+    for cls in sorted(os.listdir(raw_dir)):
+        cls_path = os.path.join(raw_dir, cls)
+        if not os.path.isdir(cls_path):
+            continue
+        with os.scandir(cls_path) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    st = entry.stat()
+                    found[f"{cls}/{entry.name}"] = (cls, st.st_size, st.st_mtime_ns)
+    return found
+
+
+def load_manifest(dataset_dir):
+    try:
+        with open(os.path.join(dataset_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def save_manifest(dataset_dir, manifest):
+    path = os.path.join(dataset_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(path + '.tmp', path)
+
+
+def scan(raw_dir, previous=None, workers=None):
+    """Manifest file entries for raw_dir, hashing only files that are new or whose size/mtime changed.
+
+    Returns (files, hashed). Hashing runs on a thread pool; hashlib releases the GIL
+    while digesting, so it spreads across cores.
+    """
+    previous = previous or {}
+    listed = list_raw_images(raw_dir)
+    files, todo = {}, []
+    for rel, (cls, size, mtime_ns) in listed.items():
+        old = previous.get(rel)
+        if old and old['size'] == size and old['mtime_ns'] == mtime_ns:
+            files[rel] = {'class': cls, 'size': size, 'mtime_ns': mtime_ns, 'sha256': old['sha256']}
+            if old.get('phash'):
+                files[rel]['phash'] = old['phash']
+        else:
+            todo.append(rel)
+    if todo:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4) as pool:
+            digests = pool.map(lambda rel: file_sha256(os.path.join(raw_dir, rel)), todo)
+            for rel, digest in zip(todo, digests):
+                cls, size, mtime_ns = listed[rel]
+                files[rel] = {'class': cls, 'size': size, 'mtime_ns': mtime_ns, 'sha256': digest}
+    return files, len(todo)
+
+
+def assign_splits(files, seed=0, val_fraction=0.2, groups=None):
+    """Set files[rel]['split'], taking the same fraction of every class for val.
+
+    Paths with the same key in `groups` (near duplicates, see dedup.py) always land in
+    the same split; a group counts towards the class of its first path. Other paths
+    are keyed by their content hash.
+    """
+    groups = groups or {}
+    units = {}
+    for rel in sorted(files):
+        units.setdefault(groups.get(rel, files[rel]['sha256']), []).append(rel)
+    by_class = {}
+    for key, rels in units.items():
+        by_class.setdefault(files[rels[0]]['class'], []).append(key)
+    for keys in by_class.values():
+        # Keyed by content, so renames and listing order don't reshuffle
+        keys.sort(key=lambda key: (hashlib.sha256(f"{seed}:{key}".encode()).hexdigest(), key))
+        total = sum(len(units[key]) for key in keys)
+        n_val = int(round(total * val_fraction))
+        if len(keys) > 1:
+            n_val = min(max(n_val, 1), total - 1) # every class needs both splits
+        in_val = 0
+        for i, key in enumerate(keys):
+            split = 'val' if in_val < n_val and i < len(keys) - 1 else 'train'
+            if split == 'val':
+                in_val += len(units[key])
+            for rel in units[key]:
+                files[rel]['split'] = split
+    return files
+
+
+def link_path(dataset_dir, rel, entry):
+    """Where entry's link lives, or None for entries left out of the dataset (duplicates)."""
+    if not entry.get('split'):
+        return None
+    return os.path.join(dataset_dir, entry['split'], rel)
+
+
+def place(src, dst, mode):
+    """Create dst as a link to (or copy of) src; returns the mode actually used."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError: # other filesystem, or links not supported
+            mode = 'symlink'
+    if mode == 'symlink':
+        try:
+            os.symlink(os.path.abspath(src), dst)
+            return 'symlink'
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def build_dataset(raw_dir, dataset_dir, seed=0, val_fraction=0.2, link='hardlink', workers=None,
+                  dedup=True, dedup_threshold=4, drop_near=False):
+    """Bring dataset_dir in line with raw_dir incrementally; returns a summary dict.
+
+    With `dedup`, exact duplicates are left out and near-duplicate groups are kept on
+    one side of the split (see dedup.py); the full report goes to dedup_report.json.
+    """
+    if link not in LINK_MODES:
+        raise ValueError(f"link must be one of {LINK_MODES}")
+    manifest = load_manifest(dataset_dir)
+    if manifest is None:
+        # Unknown contents (e.g. copies from the old prepare_dataset); start clean
+        for split in SPLITS:
+            shutil.rmtree(os.path.join(dataset_dir, split), ignore_errors=True)
+        manifest = {'files': {}}
+    old_files = manifest['files']
+    relink_all = manifest.get('link') != link
+
+    files, hashed = scan(raw_dir, old_files, workers)
+    report = None
+    if dedup:
+        kept, groups, report = deduplicate(raw_dir, files, dedup_threshold, drop_near, workers)
+        assign_splits(kept, seed, val_fraction, groups)
+        os.makedirs(dataset_dir, exist_ok=True)
+        with open(os.path.join(dataset_dir, DEDUP_REPORT_NAME), 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        assign_splits(files, seed, val_fraction)
+
+    removed = 0
+    for rel, old in old_files.items():
+        new = files.get(rel)
+        if new is None or new['split'] != old['split']:
+            path = link_path(dataset_dir, rel, old)
+            if path and os.path.lexists(path):
+                os.remove(path)
+            removed += 1
+
+    linked, used = 0, {}
+    for rel, entry in files.items():
+        old = old_files.get(rel)
+        dst = link_path(dataset_dir, rel, entry)
+        if dst is None:
+            continue
+        if (relink_all or old is None or old['sha256'] != entry['sha256'] or old['split'] != entry['split']
+                or not os.path.lexists(dst)):
+            mode = place(os.path.join(raw_dir, rel), dst, link)
+            used[mode] = used.get(mode, 0) + 1
+            linked += 1
+        for split in SPLITS: # class folders must exist in both splits
+            os.makedirs(os.path.join(dataset_dir, split, entry['class']), exist_ok=True)
+
+    save_manifest(dataset_dir, {
+        'version': MANIFEST_VERSION,
+        'raw_dir': os.path.abspath(raw_dir),
+        'seed': seed,
+        'val_fraction': val_fraction,
+        'link': link,
+        'files': files,
+    })
+    counts = {split: sum(1 for e in files.values() if e['split'] == split) for split in SPLITS}
+    summary = {'images': len(files), 'hashed': hashed, 'linked': linked, 'removed': removed,
+               'link_modes': used, 'classes': len({e['class'] for e in files.values()}), **counts}
+    if report:
+        summary['dedup'] = {k: v for k, v in report.items() if k != 'groups'}
+    return summary
+
+
+if __name__ == "__main__":
+    from train_model import RAW_DATA_DIR, DATASET_DIR
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--raw-dir", default=RAW_DATA_DIR)
+    parser.add_argument("--dataset-dir", default=DATASET_DIR)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--val-fraction", type=float, default=0.2)
+    parser.add_argument("--link", choices=LINK_MODES, default='hardlink')
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--no-dedup", action="store_true")
+    parser.add_argument("--dedup-threshold", type=int, default=4, help="max dHash bit difference for near duplicates")
+    parser.add_argument("--drop-near-duplicates", action="store_true", help="keep one image per near-duplicate group")
+    args = parser.parse_args()
+    print(build_dataset(args.raw_dir, args.dataset_dir, args.seed, args.val_fraction, args.link, args.workers,
+                        dedup=not args.no_dedup, dedup_threshold=args.dedup_threshold, drop_near=args.drop_near_duplicates))
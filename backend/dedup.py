@@ -0,0 +1,214 @@
+"""
+Exact and near-duplicate detection for the raw training photos.
+
+  python dedup.py [--threshold 4] [--workers 8]   # report only, nothing is changed
+
+Used by dataset_builder.build_dataset() before the split is drawn:
+
+- Exact duplicates (same SHA-256) are dropped, keeping the first path.
+- Near duplicates (64-bit dHash within `threshold` bits, the same perceptual hash the
+  result cache uses) are grouped, and dataset_builder puts each group wholly in train
+  or wholly in val so copies cannot leak across the split. With drop_near=True only
+  the largest file of each group is kept.
+
+Candidate pairs come from a banded index (multi-index hashing): the hash is cut into
+threshold + 1 bands, and by the pigeonhole principle two hashes within `threshold`
+bits agree exactly on at least one band. Only hashes sharing a band value are
+compared, with vectorised XOR/popcount in bounded tiles, so hundreds of thousands of
+images take seconds rather than the hours an all-pairs comparison would. Identical
+hashes are merged before that, so a crowd of blank photos is not compared pairwise.
+"""
+import os
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from preprocess import load_image
+from result_cache import perceptual_hash
+
+PHASH_BITS = 64
+PHASH_DECODE_SIZE = 64 # dHash only looks at a 9x8 thumbnail
+COMPARE_CHUNK = 1024
+
+if hasattr(np, 'bitwise_count'): # numpy >= 2.0
+    popcount = np.bitwise_count
+else:
+    _BYTE_BITS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def popcount(x):
+        x = np.ascontiguousarray(x, dtype=np.uint64)
+        return _BYTE_BITS[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1)
+
+
+def image_phash(path):
+    with open(path, 'rb') as f:
+        return perceptual_hash(load_image(f, PHASH_DECODE_SIZE))
+
+
+def bands(threshold):
+    """(shift, mask) for threshold + 1 bands covering all 64 bits as evenly as possible."""
+    n = threshold + 1
+    widths = [PHASH_BITS // n + (1 if i < PHASH_BITS % n else 0) for i in range(n)]
+    out, shift = [], 0
+    for width in widths:
+        out.append((shift, (1 << width) - 1))
+        shift += width
+    return out
+
+
+def near_duplicate_pairs(hashes, threshold):
+    """Yield index arrays (i, j), i < j, of every pair of `hashes` (uint64) within `threshold` bits."""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    for shift, mask in bands(threshold):
+        keys = (hashes >> np.uint64(shift)) & np.uint64(mask)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+            members = order[start:end]
+            bucket = hashes[members]
+            n = len(members)
+            # Tiles of at most COMPARE_CHUNK x COMPARE_CHUNK on and above the diagonal, so
+            # memory stays bounded however many hashes share a band value
+            for c in range(0, n, COMPARE_CHUNK):
+                rows = bucket[c:c + COMPARE_CHUNK, None]
+                for d in range(c, n, COMPARE_CHUNK):
+                    dist = popcount(rows ^ bucket[None, d:d + COMPARE_CHUNK])
+                    i, j = np.nonzero(dist <= threshold)
+                    i += c
+                    j += d
+                    upper = j > i
+                    if upper.any():
+                        yield members[i[upper]], members[j[upper]]
+
+
+class DisjointSet:
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def fill_phashes(raw_dir, files, workers=None):
+    """Compute entry['phash'] where missing (new or changed content); returns how many were computed."""
+    todo = [rel for rel, e in files.items() if not e.get('phash')]
+
+    def compute(rel):
+        try:
+            return image_phash(os.path.join(raw_dir, rel))
+        except (OSError, ValueError):
+            return None # unreadable; exact dedup still applies
+
+    if todo:
+        # Decoding releases the GIL (JPEG draft mode at 64 px), so threads scale across cores
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4) as pool:
+            for rel, phash in zip(todo, pool.map(compute, todo)):
+                files[rel]['phash'] = phash
+    return len(todo)
+
+
+def deduplicate(raw_dir, files, threshold=4, drop_near=False, workers=None):
+    """Mark duplicates in dataset manifest `files` and group near duplicates.
+
+    Dropped entries get split None and `duplicate_of` (the kept path). Returns
+    (kept, groups, report): the kept entries, {path: group key} for kept paths that
+    share a group with another kept path, and counts for the report.
+    """
+    for entry in files.values():
+        entry.pop('duplicate_of', None)
+
+    # Exact: one path per content hash
+    by_sha = {}
+    for rel in sorted(files):
+        by_sha.setdefault(files[rel]['sha256'], []).append(rel)
+    kept = {}
+    exact_removed = 0
+    exact_conflicts = 0
+    for rels in by_sha.values():
+        kept[rels[0]] = files[rels[0]]
+        if len({files[rel]['class'] for rel in rels}) > 1:
+            exact_conflicts += 1
+        for rel in rels[1:]:
+            files[rel].update(split=None, duplicate_of=rels[0])
+            exact_removed += 1
+
+    # Near: union every pair within threshold, then take the connected components
+    hashed = fill_phashes(raw_dir, kept, workers)
+    rels = [rel for rel in sorted(kept) if kept[rel].get('phash')]
+    hashes = np.array([int(kept[rel]['phash'], 16) for rel in rels], dtype=np.uint64)
+    components = DisjointSet(len(rels))
+    # Equal hashes (blank or dark photos all hash to 0) are joined directly, so only
+    # distinct hashes are compared pairwise
+    distinct, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    for index, rep in enumerate(first[inverse.ravel()].tolist()):
+        components.union(index, rep)
+    for i, j in near_duplicate_pairs(distinct, threshold):
+        for a, b in zip(first[i].tolist(), first[j].tolist()):
+            components.union(a, b)
+    members = {}
+    for index, rel in enumerate(rels):
+        members.setdefault(components.find(index), []).append(rel)
+    near_groups = [group for group in members.values() if len(group) > 1]
+
+    groups = {}
+    near_removed = 0
+    near_conflicts = 0
+    for group in near_groups:
+        if len({kept[rel]['class'] for rel in group}) > 1:
+            near_conflicts += 1
+        if drop_near:
+            keep = max(group, key=lambda rel: (kept[rel]['size'], rel))
+            for rel in group:
+                if rel != keep:
+                    kept.pop(rel).update(split=None, duplicate_of=keep)
+                    near_removed += 1
+        else:
+            key = min(kept[rel]['sha256'] for rel in group)
+            groups.update(dict.fromkeys(group, key))
+
+    report = {
+        'images': len(files),
+        'kept': len(kept),
+        'phashes_computed': hashed,
+        'exact_duplicates_removed': exact_removed,
+        'near_duplicate_groups': len(near_groups),
+        'images_in_near_groups': sum(len(g) for g in near_groups),
+        'near_duplicates_removed': near_removed,
+        'label_conflicts': exact_conflicts + near_conflicts, # same photo filed under different classes
+        'threshold': threshold,
+    }
+    report['groups'] = sorted(sorted(g) for g in near_groups)
+    return kept, groups, report
+
+
+if __name__ == "__main__":
+    from dataset_builder import scan, load_manifest
+    from train_model import RAW_DATA_DIR, DATASET_DIR
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--raw-dir", default=RAW_DATA_DIR)
+    parser.add_argument("--threshold", type=int, default=4)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+    previous = (load_manifest(DATASET_DIR) or {}).get('files')
+    files, _ = scan(args.raw_dir, previous, args.workers)
+    _, _, report = deduplicate(args.raw_dir, files, args.threshold, workers=args.workers)
+    groups = report.pop('groups')
+    print(json.dumps(report, indent=2))
+    for group in groups[:20]:
+        print("  " + ", ".join(group))
+    if len(groups) > 20:
+        print(f"  ... and {len(groups) - 20} more groups")
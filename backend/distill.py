@@ -0,0 +1,157 @@
+"""
+Knowledge distillation of the soil classifier into a smaller student, and the teacher/student report.
+
+  python train_model.py --profile cpu --distill                 # train a nano student from soil_model.pt
+  python distill.py --teacher soil_model.pt --student soil_model_student.pt [--from-cache]
+
+The student is trained on the usual dataset with a loss that mixes cross-entropy on
+the labels with the KL divergence to the teacher's softened predictions (Hinton et
+al.): alpha * T^2 * KL(student/T || teacher/T) + (1 - alpha) * CE. The report
+compares validation accuracy, file size, parameter count and single-image CPU latency.
+"""
+import os
+import json
+import time
+import argparse
+import statistics
+
+import torch
+import torch.nn.functional as F
+
+
+class DistillationLoss:
+    """Drop-in for ultralytics' classification criterion that also matches the teacher.
+
+    Pickles (and deep-copies) as the plain classification loss, so checkpoints and the
+    EMA copy of the student never carry the teacher along; validation loss is plain CE.
+    """
+
+    def __init__(self, teacher, temperature=4.0, alpha=0.7):
+        self.teacher = teacher.float().eval()
+        for p in self.teacher.parameters():
+            p.requires_grad_(False)
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def _teacher_log_probs(self, images):
+        if next(self.teacher.parameters()).device != images.device:
+            self.teacher.to(images.device)
+        with torch.no_grad():
+            out = self.teacher(images.float())
+        # In eval mode the Classify head returns softmax probabilities (plus logits in
+        # newer versions); log-probabilities / T soften exactly like logits / T
+        if isinstance(out, (list, tuple)):
+            return F.log_softmax(out[1], dim=1)
+        return torch.log(out.clamp_min(1e-8))
+
+    def __call__(self, preds, batch):
+        logits = preds[1] if isinstance(preds, (list, tuple)) else preds
+        hard = F.cross_entropy(logits, batch["cls"], reduction="mean")
+        t = self.temperature
+        soft = F.kl_div(F.log_softmax(logits / t, dim=1),
+                        F.log_softmax(self._teacher_log_probs(batch["img"]) / t, dim=1),
+                        reduction="batchmean", log_target=True) * t * t
+        loss = self.alpha * soft + (1 - self.alpha) * hard
+        return loss, loss.detach()
+
+    def __reduce__(self):
+        from ultralytics.utils.loss import v8ClassificationLoss
+        return (v8ClassificationLoss, ())
+
+
+def distillation_trainer(teacher_path, base, temperature=4.0, alpha=0.7):
+    """Subclass of trainer class `base` whose student model learns from the model at teacher_path."""
+    from ultralytics import YOLO
+
+    teacher = YOLO(teacher_path)
+
+    class DistillationTrainer(base):
+        def get_model(self, cfg=None, weights=None, verbose=True):
+            model = super().get_model(cfg=cfg, weights=weights, verbose=verbose)
+            names = self.data["names"]
+            names = dict(names) if isinstance(names, dict) else dict(enumerate(names))
+            # Soft targets are compared index by index, so the class order must match
+            if dict(teacher.names) != names:
+                raise ValueError(f"Teacher classes {teacher.names} do not match the dataset's {names}")
+            model.criterion = DistillationLoss(teacher.model, temperature, alpha)
+            return model
+
+    return DistillationTrainer
+
+
+def model_stats(model_path):
+    from ultralytics import YOLO
+    model = YOLO(model_path)
+    return {
+        "path": model_path,
+        "size_mb": round(os.path.getsize(model_path) / 1024 ** 2, 2),
+        "parameters": sum(p.numel() for p in model.model.parameters()),
+    }
+
+
+def cpu_latency_ms(backend, images, runs=50):
+    """Median single-image latency; the first call is a warm-up."""
+    backend.predict(images[:1])
+    timings = []
+    for i in range(runs):
+        started = time.perf_counter()
+        backend.predict([images[i % len(images)]])
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def compare(teacher_path, student_path, from_cache=False, batch_size=16, latency_runs=50):
+    """Accuracy, size and CPU latency of teacher vs student on the validation split; returns the report dict."""
+    from export_model import cached_validation_images, validation_images, read_image
+    from inference_backends import load_backend
+    from train_model import DATASET_DIR
+
+    if from_cache:
+        samples, load = cached_validation_images()
+    else:
+        samples, load = validation_images(os.path.join(DATASET_DIR, "val")), read_image
+    if not samples:
+        raise SystemExit(f"No validation images under {DATASET_DIR}/val; run train_model.py --prepare-only first.")
+    truth = [cls for _, cls in samples]
+    latency_images = [load(source) for source, _ in samples[:min(len(samples), 16)]]
+
+    report = {"validation_images": len(samples), "cpu_threads": torch.get_num_threads()}
+    predictions = {}
+    for role, path in (("teacher", teacher_path), ("student", student_path)):
+        backend = load_backend('torch', path)
+        labels = predictions[role] = []
+        for i in range(0, len(samples), batch_size):
+            labels.extend(label for label, _ in backend.predict([load(s) for s, _ in samples[i:i + batch_size]]))
+        report[role] = dict(
+            model_stats(path),
+            accuracy=round(sum(p == t for p, t in zip(labels, truth)) / len(truth), 4),
+            cpu_ms_per_image=round(cpu_latency_ms(backend, latency_images, latency_runs), 2),
+        )
+    report["agreement"] = round(sum(a == b for a, b in zip(predictions["teacher"], predictions["student"])) / len(truth), 4)
+    return report
+
+
+def print_report(report):
+    print(f"\nValidation images: {report['validation_images']}   CPU threads: {report['cpu_threads']}")
+    print(f"{'model':<10}{'top-1 acc':>10}{'size MB':>10}{'params':>12}{'CPU ms/img':>12}")
+    for role in ("teacher", "student"):
+        r = report[role]
+        print(f"{role:<10}{r['accuracy']:>10.2%}{r['size_mb']:>10.1f}{r['parameters']:>12,}{r['cpu_ms_per_image']:>12.1f}")
+    t, s = report["teacher"], report["student"]
+    print(f"student: {s['accuracy'] - t['accuracy']:+.2%} accuracy, {report['agreement']:.2%} agreement with the teacher, "
+          f"{s['size_mb'] / t['size_mb']:.0%} of the size, {t['cpu_ms_per_image'] / s['cpu_ms_per_image']:.1f}x faster per image")
+
+
+if __name__ == "__main__":
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--teacher", default=os.path.join(BASE_DIR, "soil_model.pt"))
+    parser.add_argument("--student", default=os.path.join(BASE_DIR, "soil_model_student.pt"))
+    parser.add_argument("--from-cache", action="store_true", help="validate on the decoded image cache (train_cache.py)")
+    parser.add_argument("--output", help="also write the report as JSON")
+    args = parser.parse_args()
+    report = compare(args.teacher, args.student, from_cache=args.from_cache)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
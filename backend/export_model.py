@@ -0,0 +1,120 @@
+"""
+Export soil_model.pt for the CPU inference backends and check accuracy parity.
+
+Usage:
+  python export_model.py                 # ONNX only
+  python export_model.py --int8          # + dynamically quantized INT8 ONNX
+  python export_model.py --openvino      # + OpenVINO IR
+  python export_model.py --check-only    # skip export, just compare backends
+
+The parity check runs every available backend over the validation split written by
+train_model.prepare_dataset() and compares top-1 accuracy and agreement with PyTorch.
+With --from-cache it reads the pre-decoded validation images from train_cache.py
+instead of decoding the files.
+"""
+import os
+import time
+import shutil
+import argparse
+from ultralytics import YOLO
+from inference_backends import exported_paths, load_backend
+from preprocess import MODEL_INPUT_SIZE, load_image
+from train_model import DATASET_DIR
+from train_cache import TrainCache, cache_dir_for
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "soil_model.pt")
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def export(model_path, int8=False, openvino=False, imgsz=MODEL_INPUT_SIZE):
+    paths = exported_paths(model_path)
+    model = YOLO(model_path)
+    # dynamic=True keeps the batch axis free so the server can run micro-batches
+    onnx_path = model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+    if os.path.abspath(onnx_path) != os.path.abspath(paths['onnx']):
+        shutil.move(onnx_path, paths['onnx'])
+    print(f"ONNX model written to {paths['onnx']}")
+
+    if int8:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(paths['onnx'], paths['onnx-int8'], weight_type=QuantType.QInt8)
+        # quantize_dynamic drops custom metadata; copy names/imgsz back for the backend
+        import onnx
+        src, dst = onnx.load(paths['onnx']), onnx.load(paths['onnx-int8'])
+        del dst.metadata_props[:]
+        dst.metadata_props.extend(src.metadata_props)
+        onnx.save(dst, paths['onnx-int8'])
+        print(f"INT8 ONNX model written to {paths['onnx-int8']}")
+
+    if openvino:
+        YOLO(model_path).export(format="openvino", imgsz=imgsz)
+        print(f"OpenVINO model written to {os.path.dirname(paths['openvino'])}")
+
+
+def validation_images(split_dir):
+    samples = []
+    for cls in sorted(os.listdir(split_dir)):
+        cls_dir = os.path.join(split_dir, cls)
+        if not os.path.isdir(cls_dir):
+            continue
+        for f in sorted(os.listdir(cls_dir)):
+            if f.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(cls_dir, f), cls))
+    return samples
+
+
+def cached_validation_images():
+    cache = TrainCache(cache_dir_for(DATASET_DIR, MODEL_INPUT_SIZE))
+    return [(slot, cls) for _, cls, slot in cache.samples('val')], cache.image
+
+
+def read_image(path):
+    with open(path, 'rb') as f:
+        return load_image(f)
+
+
+def check_parity(model_path, backends, batch_size=16, from_cache=False):
+    if from_cache:
+        samples, load = cached_validation_images()
+    else:
+        samples, load = validation_images(os.path.join(DATASET_DIR, "val")), read_image
+    if not samples:
+        print(f"No validation images under {DATASET_DIR}/val; run train_model.prepare_dataset() first.")
+        return
+
+    predictions = {}
+    for name in backends:
+        backend = load_backend(name, model_path)
+        if backend.name == 'torch' and name != 'torch':
+            continue  # export missing, load_backend fell back
+        labels = []
+        started = time.perf_counter()
+        for i in range(0, len(samples), batch_size):
+            images = [load(source) for source, _ in samples[i:i + batch_size]]
+            labels.extend(label for label, _ in backend.predict(images))
+        elapsed = time.perf_counter() - started
+        predictions[name] = (labels, elapsed)
+
+    reference = predictions.get('torch', (None, 0))[0]
+    truth = [cls for _, cls in samples]
+    print(f"\nValidation images: {len(samples)}")
+    print(f"{'backend':<12}{'top-1 acc':>10}{'agree w/ torch':>16}{'ms / image':>12}")
+    for name, (labels, elapsed) in predictions.items():
+        acc = sum(p == t for p, t in zip(labels, truth)) / len(truth)
+        agree = sum(p == r for p, r in zip(labels, reference)) / len(truth) if reference else float('nan')
+        print(f"{name:<12}{acc:>10.2%}{agree:>16.2%}{elapsed / len(samples) * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--openvino", action="store_true")
+    parser.add_argument("--check-only", action="store_true")
+    parser.add_argument("--from-cache", action="store_true", help="validate on the decoded image cache (train_cache.py)")
+    args = parser.parse_args()
+
+    if not args.check_only:
+        export(args.model, int8=args.int8, openvino=args.openvino)
+    check_parity(args.model, ['torch', 'onnx', 'onnx-int8', 'openvino'], from_cache=args.from_cache)
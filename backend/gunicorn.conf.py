@@ -0,0 +1,55 @@
+"""
+Gunicorn settings for multi-worker deployments.
+
+  SOIL_AI_MODEL_LOAD=prefork gunicorn -c gunicorn.conf.py app:app
+  SOIL_AI_MODEL_LOAD=prefork gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker main:app
+
+In prefork mode the app is imported (and the weights loaded) once in the master, then
+workers are forked and share those pages copy-on-write. Each worker runs its warm-up
+inference right after fork, before it accepts requests.
+"""
+import os
+import sys
+
+bind = os.environ.get("SOIL_AI_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("SOIL_AI_WORKERS", 2))
+# Threads let the Flask app's micro-batcher see concurrent requests within one worker
+worker_class = "gthread"
+threads = int(os.environ.get("SOIL_AI_THREADS", 8))
+preload_app = os.environ.get("SOIL_AI_MODEL_LOAD", "eager") == "prefork"
+timeout = 120
+
+
+def post_fork(server, worker):
+    # The master imported the app (migrations, seeding), so its pooled DB connection was
+    # copied into this worker; a connection must never be used from both sides of a fork
+    flask_app = sys.modules.get("app")
+    if flask_app is not None:
+        from database import dispose_after_fork
+        with flask_app.app.app_context():
+            dispose_after_fork(flask_app.db.engine)
+    for name in ("app", "main"):
+        registry = getattr(sys.modules.get(name), "model_registry", None)
+        if registry is None:
+            continue
+        for slot in registry.slots():
+            if slot.handle.loaded:
+                slot.handle.warmup()
+                server.log.info("Worker %s warmed up model %s: %s", worker.pid, slot.version, slot.handle.info())
+        registry.start_watcher()
+
+
+def post_worker_init(worker):
+    # After the app is loaded in this worker, with or without preload: pick up scan jobs
+    # that were queued (or left running) before this worker started, without waiting
+    # for a request to a job endpoint
+    jobs = getattr(sys.modules.get("app"), "job_queue", None)
+    if jobs is not None:
+        jobs.start()
+
+
+def worker_exit(server, worker):
+    # Write out buffered scan history before the worker goes away
+    writer = getattr(sys.modules.get("app"), "scan_writer", None)
+    if writer is not None:
+        writer.close()
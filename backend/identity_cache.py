@@ -0,0 +1,109 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+class IdentityCache:
+    """Small TTL cache of identities resolved from verified JWTs.
+
+    `get(key, loader)` returns the cached value or calls `loader()` (the DB lookup) on a
+    miss; None results are not cached. Async callers use `lookup()` / `put()` so the
+    loader can run off the event loop. Entries expire after `ttl` seconds so a deleted
+    user loses access within that bound even without an explicit invalidation.
+    Processes sharing a database share an epoch file: `bump()` rewrites it (password
+    reset, user deleted, also from scripts like reset_pwd.py) and every process drops
+    its whole cache the next time it notices the file changed, checked at most once per
+    `check_interval` seconds, so the hot path is a dict lookup plus an occasional tiny read.
+    """
+
+    def __init__(self, ttl=300, max_entries=10000, epoch_path=None, check_interval=1.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.epoch_path = epoch_path
+        self.check_interval = check_interval
+        self._entries = OrderedDict() # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._epoch = self._read_epoch()
+        self._checked_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _read_epoch(self):
+        if not self.epoch_path:
+            return None
+        try:
+            with open(self.epoch_path) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _check_epoch(self, now):
+        if self.epoch_path is None or now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        epoch = self._read_epoch()
+        if epoch != self._epoch:
+            self._epoch = epoch
+            self._entries.clear()
+            self.invalidations += 1
+
+    def lookup(self, key):
+        """Cached value for `key`, or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            self._check_epoch(now)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if value is None:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key, loader):
+        value = self.lookup(key)
+        if value is None:
+            value = loader()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, key=None):
+        """Drop one key (or everything) from this process's cache only."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+            self.invalidations += 1
+
+    def bump(self):
+        """Invalidate every process's cache (this one immediately, the others via the epoch file)."""
+        self.invalidate()
+        if self.epoch_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.epoch_path)), exist_ok=True)
+            with open(self.epoch_path, 'w') as f:
+                f.write(f"{time.time_ns()}\n")
+            with self._lock:
+                self._epoch = self._read_epoch()
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
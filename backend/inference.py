@@ -0,0 +1,147 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+# Fallback used when the YOLO weights could not be loaded
+DEFAULT_PREDICTION = ("Yellow Soil", 85.0)
+
+
+def predict_with_yolo(model, images):
+    """Run one batched predict call and return a (class_name, confidence %) per image."""
+    if model is None:
+        return [DEFAULT_PREDICTION for _ in images]
+    results = model.predict(images, verbose=False)
+    return [(r.names[r.probs.top1], float(r.probs.top1conf) * 100) for r in results]
+
+
+class _Request:
+    __slots__ = ("image", "predict_fn", "future", "enqueued_at")
+
+    def __init__(self, image, predict_fn):
+        self.image = image
+        self.predict_fn = predict_fn
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchScheduler:
+    """Collects images from concurrent requests into micro-batches for a single inference worker.
+
+    A batch is dispatched as soon as `max_batch_size` images are waiting or the oldest
+    image has waited `max_wait_ms`, whichever comes first. Requests may name their own
+    `predict_fn` (e.g. an A/B candidate model); a batch is split per model before predicting.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=8, max_wait_ms=10, max_queue=256):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._worker = None
+        self._pid = None
+
+        # Metrics
+        self._batches = 0
+        self._images = 0
+        self._errors = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._predict_total = 0.0
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(), so (re)start the worker lazily in each process
+        if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive() and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._pid = os.getpid()
+            self._worker = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+            self._worker.start()
+
+    def submit(self, image, predict_fn=None):
+        """Queue an image and return a Future resolving to (class_name, confidence %)."""
+        self._ensure_worker()
+        req = _Request(image, predict_fn or self.predict_fn)
+        self._queue.put(req)
+        return req.future
+
+    def predict(self, image, predict_fn=None, timeout=None):
+        return self.submit(image, predict_fn).result(timeout=timeout)
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            collected = self._collect()
+            groups = {}
+            for r in collected:
+                groups.setdefault(r.predict_fn, []).append(r)
+            for predict_fn, batch in groups.items():
+                self._predict(predict_fn, batch)
+
+    def _predict(self, predict_fn, batch):
+        started = time.perf_counter()
+        try:
+            predictions = list(predict_fn([r.image for r in batch]))
+        except Exception as e:
+            with self._lock:
+                self._errors += 1
+            for r in batch:
+                r.future.set_exception(e)
+            return
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self._batches += 1
+            self._images += len(batch)
+            self._predict_total += elapsed
+            for r in batch:
+                waited = started - r.enqueued_at
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+        for r, prediction in zip(batch, predictions):
+            r.future.set_result(prediction)
+        if len(predictions) < len(batch):
+            # Never leave a request thread blocked on a future nobody will resolve
+            with self._lock:
+                self._errors += 1
+            error = RuntimeError(f"Model returned {len(predictions)} predictions for {len(batch)} images")
+            for r in batch[len(predictions):]:
+                r.future.set_exception(error)
+
+    def metrics(self):
+        with self._lock:
+            batches, images = self._batches, self._images
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "queue_depth": self._queue.qsize(),
+                "batches": batches,
+                "images": images,
+                "errors": self._errors,
+                "avg_batch_size": round(images / batches, 2) if batches else 0.0,
+                "batch_fill_rate": round(images / (batches * self.max_batch_size), 4) if batches else 0.0,
+                "avg_queue_wait_ms": round(self._wait_total / images * 1000, 3) if images else 0.0,
+                "max_queue_wait_ms": round(self._wait_max * 1000, 3),
+                "avg_predict_ms": round(self._predict_total / batches * 1000, 3) if batches else 0.0,
+            }
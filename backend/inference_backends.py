@@ -0,0 +1,141 @@
+import os
+import ast
+from inference import predict_with_yolo
+from preprocess import MODEL_INPUT_SIZE
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BACKENDS = ('torch', 'onnx', 'onnx-int8', 'openvino')
+
+
+def exported_paths(model_path):
+    """Where export_model.py writes each backend's artifact for a given .pt file."""
+    stem = os.path.splitext(model_path)[0]
+    name = os.path.basename(stem)
+    return {
+        'onnx': stem + '.onnx',
+        'onnx-int8': stem + '.int8.onnx',
+        'openvino': os.path.join(stem + '_openvino_model', name + '.xml'),
+    }
+
+
+class TorchBackend:
+    name = 'torch'
+
+    def __init__(self, model_path):
+        from ultralytics import YOLO
+        self.path = model_path
+        try:
+            self.model = YOLO(model_path)
+            print("AI Model loaded successfully (PyTorch).")
+        except Exception as e:
+            print(f"Error loading model: {e}")
+            self.model = None
+        self.ready = self.model is not None
+
+    def predict(self, images):
+        return predict_with_yolo(self.model, images)
+
+
+class _ExportedBackend:
+    """Shared preprocessing for exported YOLO classifiers (NCHW float32 in [0, 1], softmax out)."""
+
+    def __init__(self, path, names, imgsz):
+        self.path = path
+        self.names = names
+        self.imgsz = imgsz
+        self.ready = True
+
+    def _to_tensor(self, images):
+        size = self.imgsz
+        batch = np.empty((len(images), 3, size, size), dtype=np.float32)
+        for i, img in enumerate(images):
+            # Same as ultralytics classify_transforms: resize shorter side, then center crop
+            if min(img.size) != size:
+                w, h = img.size
+                scale = size / min(w, h)
+                img = img.resize((max(size, round(w * scale)), max(size, round(h * scale))))
+            w, h = img.size
+            left, top = (w - size) // 2, (h - size) // 2
+            arr = np.asarray(img.crop((left, top, left + size, top + size)), dtype=np.float32)
+            batch[i] = arr.transpose(2, 0, 1) / 255.0
+        return batch
+
+    def _decode(self, probs):
+        top1 = probs.argmax(axis=1)
+        return [(self.names[int(c)], float(p[c]) * 100) for c, p in zip(top1, probs)]
+
+
+class OnnxBackend(_ExportedBackend):
+    name = 'onnx'
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        if threads:
+            opts.intra_op_num_threads = threads
+            opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        # A dynamic batch axis is needed to feed several images per run
+        self.dynamic_batch = not isinstance(self.session.get_inputs()[0].shape[0], int)
+        meta = self.session.get_modelmeta().custom_metadata_map
+        names = ast.literal_eval(meta['names'])
+        imgsz = ast.literal_eval(meta.get('imgsz', str([MODEL_INPUT_SIZE])))[0]
+        super().__init__(path, names, imgsz)
+        print(f"AI Model loaded successfully (ONNX Runtime, {path}).")
+
+    def predict(self, images):
+        batch = self._to_tensor(images)
+        if self.dynamic_batch:
+            probs = self.session.run(None, {self.input_name: batch})[0]
+        else:
+            probs = np.concatenate([self.session.run(None, {self.input_name: batch[i:i + 1]})[0] for i in range(len(batch))])
+        return self._decode(probs)
+
+
+class OpenVinoBackend(_ExportedBackend):
+    name = 'openvino'
+
+    def __init__(self, path, threads=None):
+        import yaml
+        import openvino as ov
+        core = ov.Core()
+        config = {"INFERENCE_NUM_THREADS": threads} if threads else {}
+        model = core.read_model(path)
+        self.compiled = core.compile_model(model, "CPU", config)
+        with open(os.path.join(os.path.dirname(path), "metadata.yaml")) as f:
+            meta = yaml.safe_load(f)
+        super().__init__(path, {int(k): v for k, v in meta['names'].items()}, meta.get('imgsz', [MODEL_INPUT_SIZE])[0])
+        print(f"AI Model loaded successfully (OpenVINO, {path}).")
+
+    def predict(self, images):
+        batch = self._to_tensor(images)
+        probs = np.concatenate([self.compiled(batch[i:i + 1])[0] for i in range(len(batch))])
+        return self._decode(probs)
+
+
+def load_backend(name, model_path, threads=None):
+    """Load the requested inference backend, falling back to PyTorch if its export is unavailable."""
+    if name not in BACKENDS:
+        print(f"Unknown inference backend '{name}', using torch.")
+        name = 'torch'
+    if name != 'torch':
+        path = exported_paths(model_path)[name]
+        if not os.path.exists(path):
+            print(f"No exported model at {path} (run export_model.py); falling back to torch.")
+        elif np is None:
+            print("NumPy is not installed; falling back to torch.")
+        else:
+            try:
+                if name == 'openvino':
+                    return OpenVinoBackend(path, threads)
+                return OnnxBackend(path, threads)
+            except Exception as e:
+                print(f"Error loading {name} backend: {e}; falling back to torch.")
+    return TorchBackend(model_path)
+
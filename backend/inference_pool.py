@@ -0,0 +1,57 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InferencePoolFull(Exception):
+    pass
+
+
+class AsyncInferencePool:
+    """Runs blocking decode/inference work off the event loop with bounded admission.
+
+    At most `workers` jobs execute at once and at most `max_pending` are admitted
+    (running + waiting); beyond that `run()` raises InferencePoolFull immediately so the
+    caller can answer 503 instead of queueing without bound. A job that exceeds
+    `timeout` raises asyncio.TimeoutError for the caller but keeps its slot until the
+    worker thread actually finishes, so admission reflects real executor load.
+    PIL, PyTorch and ONNX Runtime release the GIL in their heavy loops, so threads
+    give real parallelism here without duplicating the model per process.
+    """
+
+    def __init__(self, workers=2, max_pending=16, timeout=30.0):
+        self.workers = max(1, int(workers))
+        self.max_pending = max(self.workers, int(max_pending))
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _release(self, _):
+        self._pending -= 1
+        self.completed += 1
+
+    async def run(self, fn, *args):
+        # Only touched from the event loop thread, so plain counters are safe
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise InferencePoolFull()
+        self._pending += 1
+        future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+
+    def metrics(self):
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
@@ -0,0 +1,224 @@
+import os
+import json
+import shutil
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update, delete, func
+
+from models import ScanJob
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class JobQueue:
+    """Bounded job queue kept in the `scan_job` table, with a small pool of worker threads per process.
+
+    Every gunicorn worker shares the table: a job submitted to one process can be run
+    and polled from any other, and queued jobs survive a restart. The input file is
+    streamed to `job_dir` (which every worker must see) and only its path is stored;
+    it is deleted when the job finishes. `handler(path, params)` runs on a worker
+    thread and its return value (JSON-serialisable) becomes the result.
+    Idle workers only read: a plain SELECT looks for the oldest queued job, and only
+    then a conditional UPDATE claims it, so each job runs once and an empty queue never
+    takes the SQLite write lock. Idle polling backs off from `poll_interval` to
+    `max_idle_interval`; a submit in the same process wakes the workers at once. A job left 'running' for more than `stale_after` seconds belonged to a
+    process that died and is marked failed. Finished jobs are kept for `result_ttl`
+    seconds so clients can poll for them.
+    """
+
+    def __init__(self, handler, engine, job_dir, workers=2, max_pending=64, result_ttl=600,
+                 poll_interval=0.5, max_idle_interval=5.0, stale_after=300):
+        self.handler = handler
+        self.engine = engine
+        self.table = ScanJob.__table__
+        self.job_dir = job_dir
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self.max_idle_interval = max(poll_interval, max_idle_interval)
+        self.stale_after = stale_after
+        self._cond = threading.Condition()
+        self._threads = []
+        self._pid = None
+        self._recovered_at = 0.0
+
+    def start(self):
+        """Start this process's worker threads; their first pass fails jobs a dead process left running.
+
+        Called when a server process starts (gunicorn's post_worker_init, app.py's __main__)
+        rather than at import, so scripts that import the app never claim jobs.
+        """
+        self._ensure_workers()
+
+    def _ensure_workers(self):
+        # Threads do not survive fork(), so start the pool lazily in each process
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._threads = []
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"scan-job-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            self._pid = os.getpid()
+
+    def submit(self, file, params, owner=None):
+        """Copy binary `file` to the job directory, queue a job for it and return its id.
+
+        Raises QueueFull when the backlog is at capacity.
+        """
+        self._ensure_workers()
+        t = self.table
+        with self.engine.begin() as conn:
+            self._purge(conn)
+            queued = conn.execute(select(func.count()).select_from(t).where(t.c.status == 'queued')).scalar()
+        if queued >= self.max_pending:
+            raise QueueFull()
+        job_id = uuid.uuid4().hex
+        path = os.path.join(self.job_dir, job_id)
+        os.makedirs(self.job_dir, exist_ok=True)
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(file, f)
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(t.insert().values(id=job_id, status='queued', owner=owner, path=path,
+                                               params=json.dumps(params), created_at=datetime.utcnow()))
+        except Exception:
+            _remove(path)
+            raise
+        with self._cond:
+            self._cond.notify_all()
+        return job_id
+
+    def _snapshot(self, job_id):
+        t = self.table
+        with self.engine.connect() as conn:
+            row = conn.execute(select(t.c.id, t.c.status, t.c.owner, t.c.result, t.c.detail)
+                               .where(t.c.id == job_id)).mappings().first()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def get(self, job_id, wait=0):
+        """Return a snapshot of the job, blocking up to `wait` seconds for it to finish."""
+        self._ensure_workers()
+        deadline = time.time() + wait
+        job = self._snapshot(job_id)
+        # The job may run in another process, so re-read the row rather than only waiting for ours
+        while job is not None and job["status"] in ("queued", "running"):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            with self._cond:
+                self._cond.wait(min(remaining, self.poll_interval))
+            job = self._snapshot(job_id)
+        return job
+
+    def _purge(self, conn):
+        t = self.table
+        conn.execute(delete(t).where(t.c.finished_at < datetime.utcnow() - timedelta(seconds=self.result_ttl)))
+
+    def _recover(self):
+        """Fail jobs whose worker process died mid-run (at most once per stale_after / 10)."""
+        now = time.time()
+        if now - self._recovered_at < self.stale_after / 10:
+            return
+        self._recovered_at = now
+        t = self.table
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        stale = (t.c.status == 'running', t.c.started_at < cutoff)
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(t.c.id, t.c.path).where(*stale)).all()
+        if not rows:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(update(t).where(t.c.id.in_([r.id for r in rows]), *stale).values(
+                status='failed', detail="Analysis was interrupted, please resubmit the image",
+                finished_at=datetime.utcnow()))
+        for row in rows:
+            _remove(row.path)
+
+    def _oldest_queued(self):
+        t = self.table
+        with self.engine.connect() as conn:
+            return conn.execute(select(t.c.id).where(t.c.status == 'queued').order_by(t.c.created_at).limit(1)).scalar()
+
+    def _claim(self):
+        """Mark the oldest queued job as ours; returns (id, path, params) or None when there is none."""
+        t = self.table
+        job_id = self._oldest_queued()
+        while job_id is not None:
+            with self.engine.begin() as conn:
+                claimed = conn.execute(update(t).where(t.c.id == job_id, t.c.status == 'queued').values(
+                    status='running', started_at=datetime.utcnow())).rowcount
+                if claimed:
+                    row = conn.execute(select(t.c.path, t.c.params).where(t.c.id == job_id)).first()
+                    return job_id, row.path, json.loads(row.params)
+            job_id = self._oldest_queued() # another worker took it first
+        return None
+
+    def _finish(self, job_id, path, status, result=None, detail=None):
+        t = self.table
+        with self.engine.begin() as conn:
+            conn.execute(update(t).where(t.c.id == job_id).values(
+                status=status, result=json.dumps(result) if result is not None else None, detail=detail,
+                finished_at=datetime.utcnow()))
+        _remove(path)
+        with self._cond:
+            self._cond.notify_all()
+
+    def _run(self):
+        idle = self.poll_interval
+        while True:
+            try:
+                self._recover()
+                job = self._claim()
+            except Exception as e:
+                print(f"Job queue error: {e}")
+                job = None
+            if job is None:
+                with self._cond:
+                    woken = self._cond.wait(idle)
+                idle = self.poll_interval if woken else min(idle * 2, self.max_idle_interval)
+                continue
+            idle = self.poll_interval
+            job_id, path, params = job
+            try:
+                result = self.handler(path, params)
+            except Exception as e:
+                status, result, detail = "failed", None, str(e)
+            else:
+                status, detail = "done", None
+            try:
+                self._finish(job_id, path, status, result, detail)
+            except Exception as e:
+                # Left 'running'; _recover() fails it once it is stale
+                print(f"Job queue error: {e}")
+
+    def metrics(self):
+        t = self.table
+        with self.engine.connect() as conn:
+            statuses = dict(conn.execute(select(t.c.status, func.count()).group_by(t.c.status)).all())
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": statuses.get("queued", 0),
+            "jobs": statuses,
+        }
@@ -1,18 +1,23 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request, status
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+import asyncio
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import uvicorn
-import random
-from PIL import Image
-import io
 import os
-import json
 from datetime import datetime, timedelta
 from typing import Optional, List
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from pydantic import BaseModel
-from ultralytics import YOLO
+from preprocess import load_image
+from model_registry import ModelRegistry
+from soil_profiles import get_soil_stats
+from uploads import UploadError, spool_upload, MAX_UPLOAD_BYTES
+from inference_pool import AsyncInferencePool, InferencePoolFull
+from user_store import UserStore, UserExists
+from passwords import PasswordHasher, RateLimiter, RateLimited, HasherBusy, BCRYPT_ROUNDS
+from identity_cache import IdentityCache
 
 app = FastAPI()
 
@@ -21,22 +26,18 @@ SECRET_KEY = "soil-ai-secret-key-super-secure"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 # 1 day
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# --- Database Setup (JSON) ---
-DB_PATH = "users.json"
-if not os.path.exists(DB_PATH):
-    with open(DB_PATH, "w") as f:
-        json.dump({}, f)
-
-def get_db():
-    with open(DB_PATH, "r") as f:
-        return json.load(f)
-
-def save_db(data):
-    with open(DB_PATH, "w") as f:
-        json.dump(data, f, indent=4)
+# --- Database Setup (SQLite) ---
+DB_PATH = os.environ.get("SOIL_AI_USER_DB", "users.db")
+LEGACY_JSON_PATH = "users.json"
+# Verified token subject -> user, so authenticated requests skip the user lookup. The epoch
+# file tells other processes on the same users.db to drop their cached identities.
+IDENTITY_CACHE_TTL = int(os.environ.get("SOIL_AI_IDENTITY_CACHE_TTL", 300))
+IDENTITY_CACHE_MAX_ENTRIES = int(os.environ.get("SOIL_AI_IDENTITY_CACHE_MAX_ENTRIES", 10000))
+identity_cache = IdentityCache(IDENTITY_CACHE_TTL, IDENTITY_CACHE_MAX_ENTRIES, epoch_path=DB_PATH + ".epoch")
+user_store = UserStore(DB_PATH, on_change=lambda username: identity_cache.bump())
+user_store.migrate_from_json(LEGACY_JSON_PATH)
 
 # --- Models ---
 class UserCreate(BaseModel):
@@ -55,12 +56,28 @@ class Token(BaseModel):
 class ForgotPassword(BaseModel):
     email: str
 
+# --- Password hashing & login rate limits ---
+# bcrypt runs on its own small pool, never on the event loop or the inference threads
+PASSWORD_HASH_WORKERS = int(os.environ.get("SOIL_AI_PASSWORD_HASH_WORKERS", max(1, (os.cpu_count() or 4) // 4)))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get("SOIL_AI_PASSWORD_HASH_MAX_PENDING", 32))
+LOGIN_RATE_PER_IP = int(os.environ.get("SOIL_AI_LOGIN_RATE_PER_IP", 30)) # attempts per window, 0 disables
+LOGIN_RATE_PER_USER = int(os.environ.get("SOIL_AI_LOGIN_RATE_PER_USER", 10))
+LOGIN_RATE_WINDOW = int(os.environ.get("SOIL_AI_LOGIN_RATE_WINDOW", 60))
+LOGIN_RETRY_AFTER = 2
+password_hasher = PasswordHasher(BCRYPT_ROUNDS, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING)
+login_ip_limiter = RateLimiter(LOGIN_RATE_PER_IP, LOGIN_RATE_WINDOW)
+login_user_limiter = RateLimiter(LOGIN_RATE_PER_USER, LOGIN_RATE_WINDOW)
+
 # --- Helper Functions ---
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(user, plain_password):
+    # Upgrades the stored hash when SOIL_AI_BCRYPT_ROUNDS changed since it was made
+    ok, new_hash = await password_hasher.verify_async(plain_password, user["password"])
+    if new_hash:
+        await run_in_threadpool(user_store.update_password, user["username"], new_hash, notify=False)
+    return ok
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await password_hasher.hash_async(password)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -77,15 +94,39 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
+        uid = payload.get("uid")
         if username is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
     
-    db = get_db()
-    if username not in db:
-        raise credentials_exception
-    return db[username]
+    key = uid if uid is not None else ("name", username) # tokens issued before the uid claim
+    user = identity_cache.lookup(key)
+    if user is None:
+        user = await run_in_threadpool(user_store.get, username)
+        if user is None or (uid is not None and user["id"] != uid):
+            raise credentials_exception
+        user = {k: v for k, v in user.items() if k != "password"}
+        identity_cache.put(key, user)
+    return user
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    # Refuse oversized uploads from the Content-Length header, before the body is parsed
+    length = request.headers.get("content-length")
+    if request.url.path == "/analyze" and length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES + 64 * 1024:
+        return JSONResponse(status_code=413, content={"detail": f"Upload too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)"})
+    return await call_next(request)
+
+@app.exception_handler(RateLimited)
+async def rate_limited(request: Request, exc: RateLimited):
+    return JSONResponse(status_code=429, content={"detail": "Too many login attempts, please try again later"},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+@app.exception_handler(HasherBusy)
+async def hasher_busy(request: Request, exc: HasherBusy):
+    return JSONResponse(status_code=503, content={"detail": "Server busy, please retry"},
+                        headers={"Retry-After": str(LOGIN_RETRY_AFTER)})
 
 app.add_middleware(
     CORSMiddleware,
@@ -97,190 +138,110 @@ app.add_middleware(
 
 # Load AI Model
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "soil_model.pt")
-try:
-    model = YOLO(MODEL_PATH)
-    print("AI Model loaded successfully.")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    model = None
+INFERENCE_BACKEND = os.environ.get("SOIL_AI_BACKEND", "torch") # torch | onnx | onnx-int8 | openvino
+INFERENCE_THREADS = int(os.environ.get("SOIL_AI_INTRA_OP_THREADS", 0)) or None
+MODEL_LOAD_MODE = os.environ.get("SOIL_AI_MODEL_LOAD", "eager") # lazy | eager | prefork
+MODEL_POLL_INTERVAL = float(os.environ.get("SOIL_AI_MODEL_POLL_INTERVAL", 5)) # 0 disables hot reload
+model_registry = ModelRegistry(INFERENCE_BACKEND, MODEL_PATH, threads=INFERENCE_THREADS, poll_interval=MODEL_POLL_INTERVAL)
+model_registry.start(MODEL_LOAD_MODE)
+
+# Decode + inference run here, never on the event loop
+INFERENCE_WORKERS = int(os.environ.get("SOIL_AI_INFERENCE_WORKERS", 2))
+INFERENCE_MAX_PENDING = int(os.environ.get("SOIL_AI_INFERENCE_MAX_PENDING", 16))
+INFERENCE_TIMEOUT = float(os.environ.get("SOIL_AI_INFERENCE_TIMEOUT", 30))
+INFERENCE_RETRY_AFTER = 5
+inference_pool = AsyncInferencePool(INFERENCE_WORKERS, INFERENCE_MAX_PENDING, INFERENCE_TIMEOUT)
 
 # --- Auth Endpoints ---
 
 @app.post("/register")
 async def register(user: UserCreate):
-    db = get_db()
-    if user.username in db:
+    if await run_in_threadpool(user_store.get, user.username):
         raise HTTPException(status_code=400, detail="Username already exists")
-    
-    for u in db.values():
-        if u["email"] == user.email:
-            raise HTTPException(status_code=400, detail="Email already exists")
-            
-    db[user.username] = {
-        "username": user.username,
-        "email": user.email,
-        "password": get_password_hash(user.password),
-        "created_at": str(datetime.now())
-    }
-    save_db(db)
+    if await run_in_threadpool(user_store.get_by_email, user.email):
+        raise HTTPException(status_code=400, detail="Email already exists")
+
+    password = await get_password_hash(user.password)
+    try:
+        # The unique indexes settle any race between concurrent registrations
+        await run_in_threadpool(user_store.create, user.username, user.email, password, str(datetime.now()))
+    except UserExists as e:
+        raise HTTPException(status_code=400, detail=f"{e.field} already exists")
     return {"message": "User created successfully"}
 
 @app.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    db = get_db()
-    user = db.get(form_data.username)
-    if not user or not verify_password(form_data.password, user["password"]):
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    login_ip_limiter.hit(request.client.host if request.client else None)
+    login_user_limiter.hit(form_data.username)
+    user = await run_in_threadpool(user_store.get, form_data.username)
+    if not user or not await verify_password(user, form_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = create_access_token(data={"sub": user["username"]})
+    login_user_limiter.reset(form_data.username)
+    access_token = create_access_token(data={"sub": user["username"], "uid": user["id"]})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/forgot-password")
 async def forgot_password(data: ForgotPassword):
-    db = get_db()
-    user_found = False
-    for u in db.values():
-        if u["email"] == data.email:
-            user_found = True
-            break
+    user_found = await run_in_threadpool(user_store.get_by_email, data.email) is not None
     
     if not user_found:
         return {"message": "If the email is registered, you will receive a reset link shortly."}
         
     return {"message": "Password reset link sent (Simulated). Check your email."}
 
+@app.get("/health")
+async def health():
+    info = model_registry.primary.handle.info()
+    return {
+        "status": "ok" if info["ready"] or not info["loaded"] else "degraded",
+        "model": info,
+        "models": model_registry.info(),
+        "inference_pool": inference_pool.metrics(),
+        "passwords": dict(password_hasher.metrics(), rate_limited=login_ip_limiter.limited + login_user_limiter.limited),
+        "identity_cache": identity_cache.metrics()
+    }
+
 # --- Analysis Endpoint (Protected) ---
 
-@app.post("/analyze")
-async def analyze_soil(image: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
-    if model is None:
+def run_analysis(file):
+    # Blocking part of /analyze; runs on an inference_pool thread
+    slot = model_registry.route()
+    if not slot.handle.get().ready:
         raise HTTPException(status_code=500, detail="AI Model not ready.")
 
+    # UploadFile is already spooled to disk by the multipart parser; validate it in place
+    try:
+        upload = spool_upload(file, MAX_UPLOAD_BYTES)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
     try:
-        contents = await image.read()
-        img = Image.open(io.BytesIO(contents)).convert("RGB")
-        results = model.predict(img)
-        probs = results[0].probs
-        class_idx = probs.top1
-        class_name = results[0].names[class_idx]
-        conf = float(probs.top1conf)
+        img = load_image(upload.file)
+        class_name, conf = slot.predict([img])[0]
         
-        final_result = generate_mock_analysis(class_name, conf * 100)
+        final_result = get_soil_stats(class_name, conf)
         final_result["status"] = "success"
         return final_result
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
-def generate_mock_analysis(soil_type: str, confidence: float):
-    data = {
-        "Black Soil": {
-            "type": "Black (Chernozem)",
-            "texture": "Clayey / Heavy",
-            "ph": (6.5, 7.8),
-            "n": (45, 70), "p": (25, 45), "k": (50, 90), "om": (5, 9),
-            "moisture": (15, 25), "water_retention": "High",
-            "ec": (0.5, 1.2), "cec": "Low to Moderate",
-            "micro": {"Boron": "0.5 ppm", "Iron": "4.5 ppm", "Zinc": "0.8 ppm", "Manganese": "12 ppm"},
-            "season": "Post-Monsoon (Rabi)",
-            "temp": (20, 30), "drainage": "Slow", "compaction": "Moderate",
-            "climate": "Semi-Arid / Temperate",
-            "deficiencies": ["Zinc", "Nitrogen", "Boron"],
-            "fertilizer": "Urea, Zinc Sulphate, and Borax",
-            "crops": ["Cotton", "Wheat", "Linseed", "Tobacco", "Gram"]
-        },
-        "Cinder Soil": {
-            "type": "Cinder (Volcanic)",
-            "texture": "Porous / Sandy",
-            "ph": (5.8, 6.8),
-            "n": (10, 25), "p": (30, 60), "k": (40, 70), "om": (1, 3),
-            "moisture": (5, 12), "water_retention": "Very Low",
-            "ec": (0.8, 2.0), "cec": "High",
-            "micro": {"Boron": "1.2 ppm", "Iron": "25 ppm", "Zinc": "2.5 ppm", "Manganese": "40 ppm"},
-            "season": "Year-round with irrigation",
-            "temp": (15, 35), "drainage": "Excessive", "compaction": "None",
-            "climate": "Volcanic Regions / Tropical",
-            "deficiencies": ["Phosphorus", "Potassium", "Nitrogen"],
-            "fertilizer": "NPK 10-26-26 and Ammonium Nitrate",
-            "crops": ["Coffee", "Grapes", "Potatoes", "Succulents", "Orchids"]
-        },
-        "Laterite Soil": {
-            "type": "Laterite (Red)",
-            "texture": "Gravelly / Loamy",
-            "ph": (4.5, 6.0),
-            "n": (15, 30), "p": (10, 20), "k": (20, 40), "om": (2, 4),
-            "moisture": (10, 18), "water_retention": "Low",
-            "ec": (0.2, 0.6), "cec": "Very Low",
-            "micro": {"Boron": "0.2 ppm", "Iron": "15 ppm", "Zinc": "0.4 ppm", "Manganese": "5 ppm"},
-            "season": "Monsoon (Kharif)",
-            "temp": (25, 40), "drainage": "Fast", "compaction": "Low",
-            "climate": "Tropical Wet / Monsoon",
-            "deficiencies": ["Nitrogen", "Lime", "Phosphorus"],
-            "fertilizer": "DAP, Lime, and Rock Phosphate",
-            "crops": ["Cashew", "Rubber", "Tea", "Coffee", "Coconut"]
-        },
-        "Peat Soil": {
-            "type": "Peat (Muck)",
-            "texture": "Spongy / Fibrous",
-            "ph": (3.5, 5.2),
-            "n": (50, 90), "p": (5, 15), "k": (10, 25), "om": (30, 60),
-            "moisture": (40, 70), "water_retention": "Extreme",
-            "ec": (0.1, 0.4), "cec": "Extremely High",
-            "micro": {"Boron": "0.1 ppm", "Iron": "8 ppm", "Zinc": "0.2 ppm", "Manganese": "2 ppm"},
-            "season": "Summer (Zaid)",
-            "temp": (10, 25), "drainage": "Poor (Waterlogged)", "compaction": "None (Soft)",
-            "climate": "Cold Wet / Marshy",
-            "deficiencies": ["Potassium", "Copper", "Molybdenum"],
-            "fertilizer": "MOP (Muriate of Potash) and Copper Sulphate",
-            "crops": ["Blueberries", "Cranberries", "Sphagnum", "Rice", "Muck-land Vegetables"]
-        },
-        "Yellow Soil": {
-            "type": "Yellow (Podzolic)",
-            "texture": "Silty / Clay",
-            "ph": (5.0, 6.5),
-            "n": (20, 40), "p": (15, 30), "k": (30, 50), "om": (3, 5),
-            "moisture": (12, 20), "water_retention": "Moderate",
-            "ec": (0.3, 0.8), "cec": "Moderate",
-            "micro": {"Boron": "0.4 ppm", "Iron": "5 ppm", "Zinc": "0.6 ppm", "Manganese": "10 ppm"},
-            "season": "Spring / Kharif",
-            "temp": (18, 30), "drainage": "Moderate", "compaction": "High",
-            "climate": "Humid Subtropical",
-            "deficiencies": ["Iron", "Magnesium", "Calcium"],
-            "fertilizer": "Chelated Iron, Magnesium Nitrate, and Gypsum",
-            "crops": ["Paddy", "Citrus", "Soybeans", "Tea", "Cereals"]
-        }
-    }
-    
-    stats = data.get(soil_type, data["Yellow Soil"])
-    
-    return {
-        "confidence": f"{confidence:.1f}%",
-        "soil_type": stats["type"],
-        "texture": stats["texture"],
-        "ph_min": stats["ph"][0],
-        "ph_max": stats["ph"][1],
-        "nitrogen": f"{random.randint(stats['n'][0], stats['n'][1])} mg/kg",
-        "phosphorus": f"{random.randint(stats['p'][0], stats['p'][1])} mg/kg",
-        "potassium": f"{random.randint(stats['k'][0], stats['k'][1])} mg/kg",
-        "organic_matter": f"{random.uniform(stats['om'][0], stats['om'][1]):.1f}%",
-        "moisture": f"{random.randint(stats['moisture'][0], stats['moisture'][1])}%",
-        "water_retention": stats["water_retention"],
-        "salinity_ec": f"{random.uniform(stats['ec'][0], stats['ec'][1]):.2f} dS/m",
-        "cec": stats["cec"],
-        "micro_nutrients": stats["micro"],
-        "planting_season": stats["season"],
-        "optimal_temp": f"{stats['temp'][0]}°C - {stats['temp'][1]}°C",
-        "drainage_type": stats["drainage"],
-        "compaction_level": stats["compaction"],
-        "climate_zone": stats["climate"],
-        "possible_deficiencies": stats["deficiencies"],
-        "recommended_fertilizer": stats["fertilizer"],
-        "recommended_crops": stats["crops"],
-        "health_score": f"{random.randint(65, 98)}/100"
-    }
+@app.post("/analyze")
+async def analyze_soil(image: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
+    try:
+        return await inference_pool.run(run_analysis, image.file)
+    except InferencePoolFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Analysis queue is full, please retry shortly",
+            headers={"Retry-After": str(INFERENCE_RETRY_AFTER)},
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Analysis timed out")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,201 @@
+"""
+Schema migrations for the Flask database.
+
+  python migrations.py            # apply pending migrations (also done at app startup)
+  python migrations.py --status   # show the current and latest schema version
+
+The applied version lives in the one-row `schema_version` table. A brand-new database
+is created straight from models.py and stamped with the latest version; an existing
+one gets each pending migration in order, each in its own transaction holding a
+database-wide lock, so workers starting at the same time apply it once. Migrations 1
+and 2 replace the old try/except ALTER TABLE block, so they check before altering.
+"""
+import json
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from models import db, Scan, ScanRollup, StatCounter, leading_number
+from rollups import backfill
+
+
+def _columns(conn, table):
+    return {c['name'] for c in inspect(conn).get_columns(table)}
+
+
+def add_pricing_plan_details(conn):
+    existing = _columns(conn, 'pricing_plan')
+    if 'discount' not in existing:
+        conn.execute(text('ALTER TABLE pricing_plan ADD COLUMN discount VARCHAR(20)'))
+    if 'description' not in existing:
+        conn.execute(text('ALTER TABLE pricing_plan ADD COLUMN description TEXT'))
+
+
+def add_scan_model_version(conn):
+    if 'model_version' not in _columns(conn, 'scan'):
+        conn.execute(text('ALTER TABLE scan ADD COLUMN model_version VARCHAR(40)'))
+
+
+def _typed_scan_row(row):
+    row = dict(row)
+    try:
+        analysis = json.loads(row['result_data'])
+    except (TypeError, ValueError):
+        analysis = {}
+    if isinstance(row['created_at'], str):
+        row['created_at'] = datetime.fromisoformat(row['created_at'])
+    row.update(
+        confidence=leading_number(row['confidence'], float) or 0.0,
+        nitrogen=leading_number(analysis.get('nitrogen')),
+        phosphorus=leading_number(analysis.get('phosphorus')),
+        potassium=leading_number(analysis.get('potassium')),
+        ph_min=leading_number(analysis.get('ph_min'), float),
+        ph_max=leading_number(analysis.get('ph_max'), float),
+        health_score=leading_number(analysis.get('health_score')),
+    )
+    return row
+
+
+def type_scan_columns(conn, chunk_size=2000):
+    """Numeric confidence, typed N/P/K/pH/health columns and indexes on scan.
+
+    SQLite cannot change a column's type in place, so the table is rebuilt: the old
+    one is renamed, the new one created from models.py and the rows copied over in
+    chunks, parsing the formatted strings on the way.
+    """
+    if conn.dialect.name == 'sqlite':
+        conn.execute(text('ALTER TABLE scan RENAME TO scan_old'))
+        Scan.__table__.create(conn)
+        select = text('SELECT id, user_id, soil_type, confidence, result_data, model_version, created_at '
+                      'FROM scan_old WHERE id > :after ORDER BY id LIMIT :limit')
+        last_id = 0
+        while True:
+            rows = conn.execute(select, {'after': last_id, 'limit': chunk_size}).mappings().all()
+            if not rows:
+                break
+            conn.execute(Scan.__table__.insert(), [_typed_scan_row(r) for r in rows])
+            last_id = rows[-1]['id']
+        conn.execute(text('DROP TABLE scan_old'))
+        return
+
+    conn.execute(text("ALTER TABLE scan ALTER COLUMN confidence TYPE FLOAT "
+                      "USING CAST(NULLIF(REPLACE(confidence, '%', ''), '') AS FLOAT)"))
+    for name in ('nitrogen', 'phosphorus', 'potassium', 'health_score'):
+        conn.execute(text(f'ALTER TABLE scan ADD COLUMN {name} INTEGER'))
+    for name in ('ph_min', 'ph_max'):
+        conn.execute(text(f'ALTER TABLE scan ADD COLUMN {name} FLOAT'))
+    for index in Scan.__table__.indexes:
+        index.create(conn)
+    select = text('SELECT id, result_data FROM scan WHERE id > :after ORDER BY id LIMIT :limit')
+    update = text('UPDATE scan SET nitrogen = :nitrogen, phosphorus = :phosphorus, potassium = :potassium, '
+                  'ph_min = :ph_min, ph_max = :ph_max, health_score = :health_score WHERE id = :id')
+    last_id = 0
+    while True:
+        rows = conn.execute(select, {'after': last_id, 'limit': chunk_size}).mappings().all()
+        if not rows:
+            break
+        values = [_typed_scan_row(dict(r, confidence=0, created_at=None)) for r in rows]
+        conn.execute(update, [{k: v[k] for k in ('id', 'nitrogen', 'phosphorus', 'potassium', 'ph_min', 'ph_max', 'health_score')}
+                              for v in values])
+        last_id = rows[-1]['id']
+
+
+def create_rollups(conn):
+    ScanRollup.__table__.create(conn, checkfirst=True)
+    StatCounter.__table__.create(conn, checkfirst=True)
+    backfill(conn)
+
+
+# (version, description, function) in the order they must run; append only
+MIGRATIONS = [
+    (1, "pricing_plan discount and description", add_pricing_plan_details),
+    (2, "scan.model_version", add_scan_model_version),
+    (3, "typed scan columns and indexes", type_scan_columns),
+    (4, "dashboard rollups", create_rollups),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+MIGRATION_LOCK_KEY = 0x50114169 # pg_advisory_xact_lock key; any constant unique to this app
+
+
+def current_version(conn):
+    if not inspect(conn).has_table('schema_version'):
+        return None
+    return conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+
+
+def _stamp(conn, version):
+    conn.execute(text('DELETE FROM schema_version'))
+    conn.execute(text('INSERT INTO schema_version (version) VALUES (:v)'), {'v': version})
+
+
+@contextmanager
+def _locked(engine):
+    """A connection in a transaction that holds the database-wide migration lock.
+
+    Every worker runs the migrations at startup, so each step takes the lock first
+    and re-reads the schema version under it. SQLite: BEGIN IMMEDIATE takes the write
+    lock up front (pysqlite would otherwise start no transaction before DDL at all).
+    Postgres: a transaction-level advisory lock.
+    """
+    with engine.connect() as conn:
+        if conn.dialect.name != 'sqlite':
+            with conn.begin():
+                if conn.dialect.name == 'postgresql':
+                    conn.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': MIGRATION_LOCK_KEY})
+                yield conn
+            return
+        dbapi_connection = conn.connection.driver_connection
+        isolation_level = dbapi_connection.isolation_level
+        dbapi_connection.isolation_level = None # we issue BEGIN ourselves
+        try:
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+        finally:
+            dbapi_connection.isolation_level = isolation_level
+
+
+def run_migrations(engine):
+    """Bring the database at `engine` up to LATEST_VERSION; returns the versions applied.
+
+    Safe to run from several processes at once: whichever takes the lock first applies
+    a migration and the others find it already stamped.
+    """
+    with _locked(engine) as conn:
+        conn.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'))
+        if not inspect(conn).has_table('scan'):
+            db.metadata.create_all(conn)
+            _stamp(conn, LATEST_VERSION)
+            return []
+
+    applied = []
+    for number, description, migrate in MIGRATIONS:
+        with _locked(engine) as conn:
+            if current_version(conn) >= number:
+                continue
+            migrate(conn)
+            _stamp(conn, number)
+        print(f"Applied migration {number}: {description}")
+        applied.append(number)
+
+    # Tables added to models.py without needing a data migration
+    with _locked(engine) as conn:
+        db.metadata.create_all(conn)
+    return applied
+
+if __name__ == "__main__":
+    import sys
+    from app import app
+
+    with app.app_context():
+        if '--status' in sys.argv:
+            with db.engine.connect() as conn:
+                print(f"Schema version {current_version(conn)}, latest {LATEST_VERSION}")
+        else:
+            applied = run_migrations(db.engine)
+            print(f"Applied {applied}" if applied else "Schema is up to date")
@@ -0,0 +1,113 @@
+import os
+import gc
+import time
+import resource
+import threading
+from PIL import Image
+from inference_backends import load_backend, exported_paths
+from preprocess import MODEL_INPUT_SIZE
+
+# lazy:    load on the first prediction
+# eager:   load and warm up at import time, in every worker process
+# prefork: load once at import in the master (gunicorn --preload), share the weights
+#          copy-on-write with forked workers and warm up each worker after fork
+LOAD_MODES = ('lazy', 'eager', 'prefork')
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is a high-water mark, but it is the best we have off Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ModelHandle:
+    """Loads an inference backend on demand and records how long and how much memory it took."""
+
+    def __init__(self, backend_name, model_path, threads=None):
+        self.backend_name = backend_name
+        self.model_path = model_path
+        self.threads = threads
+        self._backend = None
+        self._lock = threading.Lock()
+        self.loaded_in_pid = None
+        self.load_seconds = None
+        self.load_rss_mb = None
+        self.warmup_seconds = None
+        self.warmed_up_pid = None
+
+    @property
+    def loaded(self):
+        return self._backend is not None
+
+    @property
+    def path(self):
+        """File the predictions come from; known before loading so caches can key on it."""
+        if self._backend is not None:
+            return self._backend.path
+        exported = exported_paths(self.model_path).get(self.backend_name)
+        return exported if exported and os.path.exists(exported) else self.model_path
+
+    def get(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    rss_before = rss_mb()
+                    started = time.perf_counter()
+                    backend = load_backend(self.backend_name, self.model_path, threads=self.threads)
+                    self.load_seconds = time.perf_counter() - started
+                    self.load_rss_mb = rss_mb() - rss_before
+                    self.loaded_in_pid = os.getpid()
+                    self._backend = backend
+        return self._backend
+
+    def predict(self, images):
+        return self.get().predict(images)
+
+    def warmup(self):
+        """Run one dummy inference so lazy kernels/allocations happen before real traffic."""
+        backend = self.get()
+        if not backend.ready or self.warmed_up_pid == os.getpid():
+            return
+        started = time.perf_counter()
+        backend.predict([Image.new('RGB', (MODEL_INPUT_SIZE, MODEL_INPUT_SIZE), (120, 90, 60))])
+        self.warmup_seconds = time.perf_counter() - started
+        self.warmed_up_pid = os.getpid()
+
+    def start(self, mode):
+        if mode not in LOAD_MODES:
+            print(f"Unknown model load mode '{mode}', using lazy.")
+            mode = 'lazy'
+        if mode == 'eager':
+            self.warmup()
+        elif mode == 'prefork':
+            self.get()
+            # Move everything allocated so far out of the GC's reach so collections in the
+            # workers don't write to (and therefore copy) the shared weight pages
+            gc.collect()
+            gc.freeze()
+
+    def info(self):
+        backend = self._backend
+        try:
+            weights_mb = os.path.getsize(self.path) / (1024 * 1024)
+        except OSError:
+            weights_mb = None
+        return {
+            "backend": backend.name if backend else self.backend_name,
+            "path": os.path.basename(self.path),
+            "loaded": backend is not None,
+            "ready": bool(backend and backend.ready),
+            "shared_from_master": backend is not None and self.loaded_in_pid != os.getpid(),
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "load_rss_mb": round(self.load_rss_mb, 1) if self.load_rss_mb is not None else None,
+            "warmup_seconds": round(self.warmup_seconds, 3) if self.warmup_seconds is not None else None,
+            "weights_mb": round(weights_mb, 2) if weights_mb is not None else None,
+            "rss_mb": round(rss_mb(), 1),
+            "pid": os.getpid(),
+        }
@@ -0,0 +1,208 @@
+import os
+import time
+import random
+import hashlib
+import threading
+from model_loader import ModelHandle
+
+
+def file_version(path):
+    """Short content hash identifying a model file (what Scan.model_version stores)."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+def _fingerprint(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def _fingerprints(handle):
+    """Fingerprint of the source .pt plus the file actually served (an export, for non-torch backends)."""
+    served = _fingerprint(handle.path)
+    if served is None:
+        return None
+    source = served if handle.path == handle.model_path else _fingerprint(handle.model_path)
+    return (source, served)
+
+
+def stale_export(handle):
+    """The exported file handle would serve if it is older than its source .pt, else None."""
+    if handle.path == handle.model_path:
+        return None
+    try:
+        if os.stat(handle.path).st_mtime_ns < os.stat(handle.model_path).st_mtime_ns:
+            return handle.path
+    except OSError:
+        pass
+    return None
+
+
+class ModelSlot:
+    """A loaded model version plus the latency / confidence numbers it has produced."""
+
+    def __init__(self, name, handle, version, fingerprint):
+        self.name = name
+        self.handle = handle
+        self.version = version
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self.images = 0
+        self.batches = 0
+        self.predict_seconds = 0.0
+        self.confidence_sum = 0.0
+
+    def predict(self, images):
+        started = time.perf_counter()
+        predictions = self.handle.predict(images)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.batches += 1
+            self.images += len(images)
+            self.predict_seconds += elapsed
+            self.confidence_sum += sum(conf for _, conf in predictions)
+        return predictions
+
+    def info(self):
+        with self._lock:
+            return {
+                "slot": self.name,
+                "version": self.version,
+                "images": self.images,
+                "avg_batch_ms": round(self.predict_seconds / self.batches * 1000, 3) if self.batches else 0.0,
+                "avg_confidence": round(self.confidence_sum / self.images, 2) if self.images else 0.0,
+                "model": self.handle.info(),
+            }
+
+
+class ModelRegistry:
+    """Serves the primary model (and optionally a candidate) and hot-swaps them when their files change.
+
+    A watcher thread polls the model files; a changed file is loaded and warmed up in the
+    background and only then swapped in, so in-flight requests keep using the old version.
+    Both the .pt and, for exported backends, the served export are watched: a .pt that is
+    newer than its export is not swapped in until export_model.py has been re-run.
+    `candidate_percent` of routed requests go to the candidate model when one is configured.
+    """
+
+    def __init__(self, backend_name, model_path, candidate_path=None, candidate_percent=0,
+                 threads=None, poll_interval=5.0):
+        self.backend_name = backend_name
+        self.paths = {"primary": model_path}
+        if candidate_path:
+            self.paths["candidate"] = candidate_path
+        self.candidate_percent = max(0.0, min(100.0, float(candidate_percent)))
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._watcher_pid = None
+        self.reloads = 0
+        self.reload_errors = 0
+
+    def _build(self, name, warm=True):
+        path = self.paths[name]
+        handle = ModelHandle(self.backend_name, path, threads=self.threads)
+        fingerprint = _fingerprints(handle)
+        version = file_version(handle.path) if fingerprint else None
+        if warm:
+            handle.warmup()
+        return ModelSlot(name, handle, version, fingerprint)
+
+    def start(self, mode):
+        for name in self.paths:
+            if name == "candidate" and not os.path.exists(self.paths[name]):
+                print(f"Candidate model {self.paths[name]} not found; routing all traffic to primary.")
+                continue
+            slot = self._build(name, warm=False)
+            stale = stale_export(slot.handle)
+            if stale:
+                print(f"Warning: {stale} is older than {self.paths[name]}; run export_model.py to re-export it.")
+            slot.handle.start(mode)
+            self._slots[name] = slot
+        # A prefork master never serves requests: reloading there would only dirty the
+        # pages its workers share copy-on-write. Workers start theirs after fork.
+        if self.poll_interval and mode != 'prefork':
+            self.start_watcher()
+
+    def start_watcher(self):
+        """Start the file watcher in this process (once per pid; gunicorn's post_fork calls it)."""
+        # Like the inference worker, the watcher must be (re)started after fork
+        if self._watcher_pid == os.getpid() or not self.poll_interval:
+            return
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+            threading.Thread(target=self._watch, name="model-watcher", daemon=True).start()
+
+    def _watch(self):
+        pending = {}
+        failed = {}
+        while True:
+            time.sleep(self.poll_interval)
+            for name, path in self.paths.items():
+                slot = self._slots.get(name)
+                current = _fingerprints(ModelHandle(self.backend_name, path))
+                if current is None or (slot and current == slot.fingerprint) or failed.get(name) == current:
+                    pending.pop(name, None)
+                    continue
+                # Wait one more poll with the same fingerprint so a file still being copied is skipped
+                if pending.get(name) != current:
+                    pending[name] = current
+                    continue
+                pending.pop(name, None)
+                if self.reload(name) is None:
+                    failed[name] = current
+
+    def reload(self, name="primary"):
+        """Load, warm up and atomically swap in the current file for a slot."""
+        try:
+            # Swapping in an export of the previous weights would report the new .pt's
+            # change as applied; keep the current model until the export catches up
+            stale = stale_export(ModelHandle(self.backend_name, self.paths[name]))
+            if stale:
+                raise RuntimeError(f"{stale} is older than {self.paths[name]}; run export_model.py to re-export it")
+            slot = self._build(name)
+            if not slot.handle.get().ready:
+                raise RuntimeError(f"model at {slot.handle.path} failed to load")
+        except Exception as e:
+            self.reload_errors += 1
+            print(f"Model reload for {name} failed: {e}")
+            return None
+        with self._lock:
+            old = self._slots.get(name)
+            self._slots[name] = slot
+            self.reloads += 1
+        print(f"Model {name} swapped to version {slot.version}" + (f" (was {old.version})" if old else ""))
+        return slot
+
+    def route(self):
+        """Pick the slot that should serve the next request."""
+        self.start_watcher()
+        slots = self._slots
+        candidate = slots.get("candidate")
+        if candidate is not None and random.random() * 100 < self.candidate_percent:
+            return candidate
+        return slots["primary"]
+
+    @property
+    def primary(self):
+        return self._slots["primary"]
+
+    def slots(self):
+        return list(self._slots.values())
+
+    def info(self):
+        return {
+            "candidate_percent": self.candidate_percent if "candidate" in self._slots else 0,
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "slots": [slot.info() for slot in self.slots()],
+        }
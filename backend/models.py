@@ -1,6 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
+import re
+import json
 
 db = SQLAlchemy()
 
@@ -14,12 +16,46 @@ class User(UserMixin, db.Model):
     scans = db.relationship('Scan', backref='owner', lazy=True)
 
 class Scan(db.Model):
+    __table_args__ = (
+        db.Index('ix_scan_user_created', 'user_id', 'created_at'), # per-user history, newest first
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
-    soil_type = db.Column(db.String(100), nullable=False)
-    confidence = db.Column(db.String(20), nullable=False)
+    soil_type = db.Column(db.String(100), nullable=False, index=True)
+    confidence = db.Column(db.Float, nullable=False) # percent, 0-100
     result_data = db.Column(db.Text, nullable=False) # JSON string
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    model_version = db.Column(db.String(40), nullable=True) # soil_model file hash that produced this scan
+    # Frequently queried analysis values, also kept in result_data
+    nitrogen = db.Column(db.Integer, nullable=True) # mg/kg
+    phosphorus = db.Column(db.Integer, nullable=True) # mg/kg
+    potassium = db.Column(db.Integer, nullable=True) # mg/kg
+    ph_min = db.Column(db.Float, nullable=True)
+    ph_max = db.Column(db.Float, nullable=True)
+    health_score = db.Column(db.Integer, nullable=True) # out of 100
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+def leading_number(value, cast=int):
+    """Numeric prefix of a formatted analysis value ('45 mg/kg' -> 45, '87/100' -> 87), or None."""
+    if isinstance(value, (int, float)):
+        return cast(value)
+    match = re.match(r'\s*(-?\d+(?:\.\d+)?)', value or '')
+    return cast(float(match.group(1))) if match else None
+
+def scan_values(soil_type, confidence, analysis, model_version=None, user_id=None):
+    """Column values for a Scan row built from an analysis dict (see soil_profiles.generate)."""
+    return {
+        "user_id": user_id,
+        "soil_type": soil_type,
+        "confidence": round(float(confidence), 1),
+        "result_data": json.dumps(analysis),
+        "model_version": model_version,
+        "nitrogen": leading_number(analysis.get("nitrogen")),
+        "phosphorus": leading_number(analysis.get("phosphorus")),
+        "potassium": leading_number(analysis.get("potassium")),
+        "ph_min": leading_number(analysis.get("ph_min"), float),
+        "ph_max": leading_number(analysis.get("ph_max"), float),
+        "health_score": leading_number(analysis.get("health_score")),
+    }
 
 class SiteSetting(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -35,3 +71,34 @@ class PricingPlan(db.Model):
     features = db.Column(db.Text, nullable=False) # Comma separated or HTML
     is_featured = db.Column(db.Boolean, default=False)
     order = db.Column(db.Integer, default=0)
+
+class ScanRollup(db.Model):
+    # Pre-aggregated scan statistics per time bucket and soil type (see rollups.py)
+    granularity = db.Column(db.String(8), primary_key=True) # 'hour' | 'day' | 'all'
+    bucket = db.Column(db.DateTime, primary_key=True) # start of the hour/day; ROLLUP_EPOCH for 'all'
+    soil_type = db.Column(db.String(100), primary_key=True)
+    scans = db.Column(db.Integer, nullable=False, default=0)
+    confidence_sum = db.Column(db.Float, nullable=False, default=0.0)
+    health_sum = db.Column(db.Integer, nullable=False, default=0)
+    health_count = db.Column(db.Integer, nullable=False, default=0)
+
+class StatCounter(db.Model):
+    # Running totals kept up to date on write, e.g. 'users'
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+class ScanJob(db.Model):
+    # Async /api/analyze/jobs queue shared by every worker process (see jobs.py)
+    __table_args__ = (
+        db.Index('ix_scan_job_status_created', 'status', 'created_at'), # oldest queued job first
+    )
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(10), nullable=False) # 'queued' | 'running' | 'done' | 'failed'
+    owner = db.Column(db.String(80), nullable=True) # JWT identity that may read the result
+    path = db.Column(db.String(255), nullable=False) # the uploaded image in the job directory; deleted once the job ran
+    params = db.Column(db.Text, nullable=False) # JSON
+    result = db.Column(db.Text, nullable=True) # JSON
+    detail = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
@@ -0,0 +1,44 @@
+import json
+import base64
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(values):
+    """Opaque URL-safe cursor for the sort-key values of the last row on a page."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    """Sort-key values from `encode_cursor`, or None if the cursor is missing or malformed."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if len(values) != len(columns):
+            return None
+        return [datetime.fromisoformat(v) if v is not None and col.type.python_type is datetime else v
+                for v, col in zip(values, columns)]
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+
+
+def keyset_page(query, columns, cursor=None, per_page=50, descending=True):
+    """One page of `query` ordered by `columns` (unique together) and the cursor for the next.
+
+    Rows after the cursor are found with a row-value comparison on the sort key, so a
+    deep page costs the same index range scan as the first one, unlike OFFSET.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    after = decode_cursor(cursor, columns)
+    if after is not None:
+        key = tuple_(*columns)
+        query = query.filter(key < tuple_(*after) if descending else key > tuple_(*after))
+    query = query.order_by(*[c.desc() if descending else c.asc() for c in columns])
+    rows = query.limit(per_page + 1).all()
+    if len(rows) <= per_page:
+        return rows, None
+    rows = rows[:per_page]
+    return rows, encode_cursor([getattr(rows[-1], c.key) for c in columns])
@@ -0,0 +1,186 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get('SOIL_AI_BCRYPT_ROUNDS', 12))
+# bcrypt only looks at the first 72 bytes; newer releases raise instead of truncating
+BCRYPT_MAX_BYTES = 72
+
+
+class HasherBusy(Exception):
+    pass
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many attempts, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+def hash_rounds(hashed):
+    """Cost factor of a bcrypt hash ('$2b$12$...' -> 12), or None if it is not bcrypt."""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """bcrypt on a small dedicated pool so password checks cannot crowd out inference.
+
+    At most `workers` hashes run at once (bcrypt releases the GIL, so each one really
+    occupies a core) and at most `max_pending` are admitted; beyond that HasherBusy is
+    raised so the endpoint can answer 503 instead of piling up CPU-bound work; so is
+    a request that waits longer than `timeout` for its result.
+    `verify()` also returns a fresh hash when the stored one was made with a different
+    cost factor, so changing SOIL_AI_BCRYPT_ROUNDS upgrades users as they log in.
+    """
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=1, max_pending=32, timeout=10.0):
+        self.rounds = int(rounds)
+        self.workers = max(1, int(workers))
+        self.max_pending = max(self.workers, int(max_pending))
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    # --- blocking primitives (run on the pool) ---
+
+    @staticmethod
+    def _encode(password):
+        return (password or '').encode('utf-8')[:BCRYPT_MAX_BYTES]
+
+    def _hash(self, password):
+        hashed = bcrypt.hashpw(self._encode(password), bcrypt.gensalt(self.rounds)).decode('utf-8')
+        with self._lock:
+            self.hashed += 1
+        return hashed
+
+    def _verify(self, password, hashed):
+        try:
+            ok = bcrypt.checkpw(self._encode(password), hashed.encode('utf-8'))
+        except (AttributeError, ValueError):
+            ok = False # Missing or malformed stored hash
+        with self._lock:
+            self.verified += 1
+        if not ok or hash_rounds(hashed) == self.rounds:
+            return ok, None
+        with self._lock:
+            self.rehashed += 1
+        return True, self._hash(password)
+
+    # --- admission ---
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise HasherBusy()
+            self._pending += 1
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _):
+        with self._lock:
+            self._pending -= 1
+
+    # --- public API ---
+
+    def _result(self, future):
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            # Queued behind a saturated pool for too long; shed like a full queue
+            with self._lock:
+                self.timed_out += 1
+            raise HasherBusy()
+
+    async def _result_async(self, future):
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise HasherBusy()
+
+    def hash(self, password):
+        return self._result(self._submit(self._hash, password))
+
+    def verify(self, password, hashed):
+        """Returns (matches, new_hash); new_hash is set when the stored hash should be replaced."""
+        return self._result(self._submit(self._verify, password, hashed))
+
+    async def hash_async(self, password):
+        return await self._result_async(self._submit(self._hash, password))
+
+    async def verify_async(self, password, hashed):
+        return await self._result_async(self._submit(self._verify, password, hashed))
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "hashed": self.hashed,
+                "verified": self.verified,
+                "rehashed": self.rehashed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+
+class RateLimiter:
+    """Sliding-window attempt counter: at most `limit` hits per key every `window` seconds."""
+
+    def __init__(self, limit, window=60.0, max_keys=100000):
+        self.limit = int(limit)
+        self.window = float(window)
+        self.max_keys = max_keys
+        self._hits = {}
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def hit(self, key):
+        """Record an attempt for `key`; raises RateLimited if it is over the limit."""
+        if self.limit <= 0 or key is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if hits is None:
+                if len(self._hits) >= self.max_keys:
+                    self._sweep(now)
+                hits = self._hits[key] = deque()
+            while hits and now - hits[0] >= self.window:
+                hits.popleft()
+            if len(hits) >= self.limit:
+                self.limited += 1
+                raise RateLimited(max(1, int(self.window - (now - hits[0])) + 1))
+            hits.append(now)
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def _sweep(self, now):
+        stale = [k for k, hits in self._hits.items() if not hits or now - hits[-1] >= self.window]
+        for k in stale:
+            del self._hits[k]
+        if len(self._hits) >= self.max_keys:
+            # Still full of active keys: forget the oldest half rather than grow without bound
+            for k in sorted(self._hits, key=lambda k: self._hits[k][-1])[:len(self._hits) // 2]:
+                del self._hits[k]
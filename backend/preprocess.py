@@ -0,0 +1,31 @@
+import io
+import os
+from PIL import Image, ImageOps
+
+# Must match the imgsz the classifier was trained with (see train_model.py)
+MODEL_INPUT_SIZE = int(os.environ.get('SOIL_AI_IMGSZ', 416))
+
+
+def load_image(source, size=MODEL_INPUT_SIZE):
+    """Decode an upload straight to an RGB image whose shorter side is `size` pixels.
+
+    JPEGs are decoded with libjpeg's DCT scaling (draft mode), so a 12 MP phone photo
+    is never materialized at full resolution. EXIF orientation is applied so rotated
+    photos reach the model upright. `source` may be raw bytes or a binary file object.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    img = Image.open(source)
+    if img.format == 'JPEG':
+        # Picks the largest 1/2, 1/4 or 1/8 scale that still covers size x size
+        img.draft('RGB', (size, size))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    w, h = img.size
+    scale = size / min(w, h)
+    if scale < 1:
+        # The classifier resizes the shorter side to `size` anyway; do it once here
+        img = img.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.BILINEAR, reducing_gap=2.0)
+    return img
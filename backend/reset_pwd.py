@@ -1,10 +1,10 @@
-from app import app, db, User, bcrypt
+from app import app, db, User, password_hasher
 
 def reset_pwd(username, password):
     with app.app_context():
         user = User.query.filter_by(username=username).first()
         if user:
-            user.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+            user.password_hash = password_hasher.hash(password)
             db.session.commit()
             print(f"Password for {username} reset to {password}")
         else:
@@ -0,0 +1,129 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Rough per-entry footprint (key, tuple, OrderedDict node) used for the memory cap
+ENTRY_OVERHEAD = 320
+
+
+def perceptual_hash(img, size=8):
+    """64-bit difference hash (dHash) of a PIL image, stable across re-encoding and resizing."""
+    gray = img.convert('L').resize((size + 1, size))
+    pixels = list(gray.getdata())
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:016x}"
+
+
+class ResultCache:
+    """LRU + TTL cache of (class_name, confidence) predictions keyed by upload content hash.
+
+    Entries are dropped automatically when the model file's size or mtime changes so a
+    retrained model never serves labels produced by its predecessor.
+    """
+
+    def __init__(self, model_path, max_entries=10000, max_bytes=8 * 1024 * 1024, ttl=3600, use_phash=False):
+        self.model_path = model_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.use_phash = use_phash
+        self._entries = OrderedDict()  # digest -> (prediction, expires_at, size, phash)
+        self._phash_index = {}         # phash -> digest
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._fingerprint = self._model_fingerprint()
+
+        self.hits = 0
+        self.phash_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _model_fingerprint(self):
+        try:
+            st = os.stat(self.model_path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _check_model(self):
+        fingerprint = self._model_fingerprint()
+        if fingerprint != self._fingerprint:
+            self._fingerprint = fingerprint
+            self._clear()
+            self.invalidations += 1
+
+    def _clear(self):
+        self._entries.clear()
+        self._phash_index.clear()
+        self._bytes = 0
+
+    def _remove(self, digest):
+        prediction, _, size, phash = self._entries.pop(digest)
+        self._bytes -= size
+        if phash is not None and self._phash_index.get(phash) == digest:
+            del self._phash_index[phash]
+
+    def _lookup(self, digest):
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        if entry[1] < time.time():
+            self._remove(digest)
+            return None
+        self._entries.move_to_end(digest)
+        return entry[0]
+
+    def get(self, digest):
+        with self._lock:
+            self._check_model()
+            prediction = self._lookup(digest)
+            if prediction is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return prediction
+
+    def get_by_phash(self, phash):
+        """Second-chance lookup for an upload whose bytes missed but whose image looks identical."""
+        with self._lock:
+            digest = self._phash_index.get(phash)
+            prediction = self._lookup(digest) if digest is not None else None
+            if prediction is not None:
+                self.phash_hits += 1
+                self.misses -= 1  # the earlier byte-level miss turned into a hit
+                self.hits += 1
+            return prediction
+
+    def put(self, digest, prediction, phash=None):
+        size = ENTRY_OVERHEAD + len(prediction[0])
+        with self._lock:
+            if digest in self._entries:
+                self._remove(digest)
+            self._entries[digest] = (prediction, time.time() + self.ttl, size, phash)
+            self._bytes += size
+            if phash is not None:
+                self._phash_index[phash] = digest
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "phash_hits": self.phash_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
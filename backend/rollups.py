@@ -0,0 +1,177 @@
+"""
+Incremental statistics for the admin dashboard.
+
+  python rollups.py --backfill   # rebuild every aggregate from the scan and user tables
+
+Every scan insert also upserts three ScanRollup rows (its hour, its day and the
+all-time 'all' bucket, per soil type) in the same transaction, and user inserts and
+deletes adjust the 'users' StatCounter. The dashboard reads a handful of rollup rows
+instead of counting the scan table, so its cost does not grow with history.
+"""
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, delete, event
+
+from models import db, Scan, User, ScanRollup, StatCounter
+
+GRANULARITIES = ('hour', 'day', 'all')
+ROLLUP_EPOCH = datetime(1970, 1, 1)
+SUM_COLUMNS = ('scans', 'confidence_sum', 'health_sum', 'health_count')
+
+
+def bucket_start(created_at, granularity):
+    if granularity == 'hour':
+        return created_at.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return ROLLUP_EPOCH
+
+
+def _insert(conn, table):
+    # INSERT ... ON CONFLICT; database.init_database() only accepts SQLite and PostgreSQL
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def _upsert_add(conn, table, rows, key_columns, add_columns):
+    """Insert `rows`, adding `add_columns` onto the existing row when the key already exists."""
+    if not rows:
+        return
+    stmt = _insert(conn, table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(key_columns),
+        set_={c: table.c[c] + stmt.excluded[c] for c in add_columns}
+    )
+    conn.execute(stmt, rows)
+
+
+def record_scans(conn, rows):
+    """Fold scan rows (dicts with soil_type, confidence, health_score, created_at) into the rollups."""
+    totals = defaultdict(lambda: dict.fromkeys(SUM_COLUMNS, 0))
+    for row in rows:
+        created_at = row.get('created_at') or datetime.utcnow()
+        for granularity in GRANULARITIES:
+            t = totals[(granularity, bucket_start(created_at, granularity), row['soil_type'])]
+            t['scans'] += 1
+            t['confidence_sum'] += row['confidence'] or 0.0
+            if row.get('health_score') is not None:
+                t['health_sum'] += row['health_score']
+                t['health_count'] += 1
+    _upsert_add(conn, ScanRollup.__table__,
+                [dict(t, granularity=g, bucket=b, soil_type=s) for (g, b, s), t in totals.items()],
+                ('granularity', 'bucket', 'soil_type'), SUM_COLUMNS)
+
+
+def add_to_counter(conn, name, amount):
+    _upsert_add(conn, StatCounter.__table__, [{'name': name, 'value': amount}], ('name',), ('value',))
+
+
+def bump_version(conn, name):
+    """Advance the version counter `name` to the current Unix time (or +1 if that is not later).
+
+    Versions therefore only ever grow and double as a last-modified timestamp.
+    """
+    table = StatCounter.__table__
+    stmt = _insert(conn, table)
+    greatest = func.max if conn.dialect.name == 'sqlite' else func.greatest
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'value': greatest(table.c.value + 1, stmt.excluded.value)}
+    ), {'name': name, 'value': int(time.time())})
+
+
+@event.listens_for(User, 'after_insert')
+def user_inserted(mapper, connection, target):
+    add_to_counter(connection, 'users', 1)
+
+
+@event.listens_for(User, 'after_delete')
+def user_deleted(mapper, connection, target):
+    add_to_counter(connection, 'users', -1)
+
+
+def _hour_bucket(conn, column):
+    if conn.dialect.name == 'postgresql':
+        return func.date_trunc('hour', column)
+    return func.strftime('%Y-%m-%d %H:00:00.000000', column)
+
+
+def backfill(conn):
+    """Recompute every aggregate from scratch with GROUP BY queries over scan and user."""
+    rollup = ScanRollup.__table__
+    conn.execute(delete(rollup))
+    # Only the counters rebuilt below; version counters (site_cache) must survive
+    conn.execute(delete(StatCounter.__table__).where(StatCounter.name == 'users'))
+
+    hour = _hour_bucket(conn, Scan.created_at)
+    hourly = conn.execute(
+        select(hour.label('bucket'), Scan.soil_type, func.count(), func.coalesce(func.sum(Scan.confidence), 0.0),
+               func.coalesce(func.sum(Scan.health_score), 0), func.count(Scan.health_score))
+        .where(Scan.created_at.is_not(None))
+        .group_by(hour, Scan.soil_type)
+    ).all()
+    # Day and all-time rows are summed from the (much smaller) hourly result; keys must be
+    # unique before the upsert since drivers may send it as one multi-row statement
+    totals = defaultdict(lambda: dict.fromkeys(SUM_COLUMNS, 0))
+    for bucket, soil_type, *values in hourly:
+        if isinstance(bucket, str):
+            bucket = datetime.fromisoformat(bucket)
+        for granularity in GRANULARITIES:
+            t = totals[(granularity, bucket_start(bucket, granularity), soil_type)]
+            for column, value in zip(SUM_COLUMNS, values):
+                t[column] += value
+    _upsert_add(conn, rollup, [dict(t, granularity=g, bucket=b, soil_type=s) for (g, b, s), t in totals.items()],
+                ('granularity', 'bucket', 'soil_type'), SUM_COLUMNS)
+
+    users = conn.execute(select(func.count()).select_from(User.__table__)).scalar()
+    add_to_counter(conn, 'users', users)
+    return len(hourly)
+
+
+# --- dashboard reads ---
+
+def counter(name):
+    return db.session.query(StatCounter.value).filter_by(name=name).scalar() or 0
+
+
+def soil_type_totals():
+    """All-time [(soil_type, scans, avg confidence, avg health)] sorted by scans."""
+    rows = ScanRollup.query.filter_by(granularity='all').all()
+    return sorted(((r.soil_type, r.scans, r.confidence_sum / r.scans if r.scans else 0.0,
+                    r.health_sum / r.health_count if r.health_count else None) for r in rows),
+                  key=lambda r: -r[1])
+
+
+def series(granularity, since):
+    """[(bucket, scans, avg confidence)] for every bucket since `since`, all soil types together, gaps as 0."""
+    rows = (db.session.query(ScanRollup.bucket, func.sum(ScanRollup.scans), func.sum(ScanRollup.confidence_sum))
+            .filter(ScanRollup.granularity == granularity, ScanRollup.bucket >= since)
+            .group_by(ScanRollup.bucket).all())
+    by_bucket = {b: (n, c) for b, n, c in rows}
+    step = timedelta(hours=1) if granularity == 'hour' else timedelta(days=1)
+    out = []
+    bucket = bucket_start(since, granularity)
+    end = datetime.utcnow()
+    while bucket <= end:
+        n, c = by_bucket.get(bucket, (0, 0.0))
+        out.append((bucket, n, c / n if n else 0.0))
+        bucket += step
+    return out
+
+
+if __name__ == "__main__":
+    import sys
+    from app import app
+
+    if '--backfill' not in sys.argv:
+        print(__doc__)
+        sys.exit(1)
+    with app.app_context():
+        with db.engine.begin() as conn:
+            buckets = backfill(conn)
+        print(f"Rebuilt rollups from {buckets} hourly buckets; {counter('users')} users")
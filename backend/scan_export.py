@@ -0,0 +1,67 @@
+import io
+import csv
+import json
+
+from sqlalchemy import select
+
+from models import db, Scan, User
+
+# format -> (mimetype, file extension)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+}
+SCAN_FIELDS = ('id', 'created_at', 'username', 'soil_type', 'confidence', 'model_version',
+               'nitrogen', 'phosphorus', 'potassium', 'ph_min', 'ph_max', 'health_score')
+YIELD_PER = 1000 # rows fetched from the database cursor at a time
+FLUSH_BYTES = 64 * 1024 # response chunk size
+
+
+def export_select(fmt):
+    """Base statement for an export, newest first. Callers add their .filter() clauses.
+
+    CSV only carries the typed columns; NDJSON also carries the full analysis blob.
+    """
+    columns = [Scan.id, Scan.created_at, User.username, Scan.soil_type, Scan.confidence, Scan.model_version,
+               Scan.nitrogen, Scan.phosphorus, Scan.potassium, Scan.ph_min, Scan.ph_max, Scan.health_score]
+    if fmt == 'ndjson':
+        columns.append(Scan.result_data)
+    return (select(*columns)
+            .outerjoin(User, Scan.user_id == User.id)
+            .order_by(Scan.created_at.desc(), Scan.id.desc()))
+
+
+def _ndjson_line(row):
+    record = {field: value for field, value in zip(SCAN_FIELDS, row)}
+    record['created_at'] = record['created_at'].isoformat() if record['created_at'] else None
+    # result_data is already JSON text we wrote ourselves; splice it in rather than
+    # parsing and re-serialising every blob
+    return json.dumps(record)[:-1] + ', "analysis": ' + (row.result_data or 'null') + '}\n'
+
+
+def stream_scans(stmt, fmt):
+    """Generator of response chunks for `stmt`, reading YIELD_PER rows at a time.
+
+    The statement runs with yield_per (a server-side cursor where the driver has one), so
+    neither the rows nor their result_data blobs are ever all in memory together.
+    """
+    result = db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+    buf = io.StringIO()
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(buf)
+        writer.writerow(SCAN_FIELDS)
+    try:
+        for row in result:
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                buf.write(_ndjson_line(row))
+            if buf.tell() >= FLUSH_BYTES:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+    finally:
+        result.close()
@@ -0,0 +1,206 @@
+import os
+import glob
+import json
+import time
+import threading
+from collections import deque
+
+
+class ScanWriter:
+    """Write-behind buffer for scan history rows.
+
+    `record(row)` only appends a JSON-serialisable dict to an in-memory queue; a
+    background thread hands them to `write_fn(rows)` in batches of up to `batch_size`,
+    at least every `flush_interval` seconds. Rows that cannot be written (the database
+    is down, or the process is shutting down with a backlog) are appended to a spill
+    file in `spill_dir` and fsynced; `replay()` loads them back, so a scan is never lost
+    because the response went out before its row was committed.
+    If more than `max_pending` rows are queued, `record()` writes inline instead of
+    buffering, which slows requests down rather than growing memory without bound.
+    """
+
+    def __init__(self, write_fn, batch_size=100, flush_interval=0.5, max_pending=10000, spill_dir=None):
+        self.write_fn = write_fn
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.max_pending = max(self.batch_size, int(max_pending))
+        self.spill_dir = spill_dir
+        self._rows = deque()
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closing = False
+        self._in_flight = 0
+        self.flushed = 0
+        self.failed = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.inline = 0
+
+    def _ensure_thread(self):
+        # Threads do not survive fork(), so start the flusher lazily in each process
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._rows = deque()
+            self._closing = False
+            self._thread = threading.Thread(target=self._run, name="scan-writer", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def record(self, row):
+        self._ensure_thread()
+        with self._cond:
+            if not self._closing and len(self._rows) < self.max_pending:
+                self._rows.append(row)
+                if len(self._rows) >= self.batch_size:
+                    self._cond.notify()
+                return
+        # Backlog full (or shutting down): fall back to a synchronous write
+        with self._cond:
+            self.inline += 1
+        self._write([row])
+
+    def _take(self):
+        batch = []
+        while self._rows and len(batch) < self.batch_size:
+            batch.append(self._rows.popleft())
+        self._in_flight = len(batch)
+        return batch
+
+    def _write(self, rows):
+        try:
+            self.write_fn(rows)
+        except Exception as e:
+            print(f"Scan writer: failed to write {len(rows)} scans ({e}), spilling to disk")
+            with self._cond:
+                self.failed += len(rows)
+            self._spill(rows)
+        else:
+            with self._cond:
+                self.flushed += len(rows)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._rows) < self.batch_size and not self._closing:
+                    self._cond.wait(self.flush_interval)
+                if self._closing:
+                    return
+                batch = self._take()
+            if batch:
+                self._write(batch)
+            with self._cond:
+                self._in_flight = 0
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Block until every row recorded so far has been written (or spilled)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify()
+            while self._rows or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else self.flush_interval)
+        return True
+
+    def close(self, timeout=10.0):
+        """Stop the flusher and write out the backlog, spilling whatever is left to disk."""
+        if self._pid != os.getpid():
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        with self._cond:
+            rows = list(self._rows)
+            self._rows.clear()
+        if not rows:
+            return
+        if self._thread.is_alive():
+            # The flusher is stuck on the database; don't race it, go straight to disk
+            self._spill(rows)
+            return
+        deadline = time.monotonic() + timeout
+        while rows and time.monotonic() < deadline:
+            batch, rows = rows[:self.batch_size], rows[self.batch_size:]
+            self._write(batch)
+        if rows:
+            self._spill(rows)
+
+    # --- spill files ---
+
+    def _spill_path(self):
+        return os.path.join(self.spill_dir, f"scan_spill.{os.getpid()}.jsonl")
+
+    def _spill(self, rows):
+        if not self.spill_dir:
+            print(f"Scan writer: no spill directory, dropping {len(rows)} scans")
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with self._spill_lock, open(self._spill_path(), 'a') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        with self._cond:
+            self.spilled += len(rows)
+
+    def replay(self):
+        """Write rows spilled by this or earlier processes; returns how many were written.
+
+        Each spill file is claimed with an atomic rename first, so concurrent workers
+        replaying at startup never insert the same rows twice.
+        """
+        if not self.spill_dir:
+            return 0
+        written = 0
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, 'scan_spill.*.jsonl'))):
+            claimed = f"{path}.replay-{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue # another worker got it
+            with open(claimed) as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+            done = 0
+            try:
+                while done < len(rows):
+                    batch = rows[done:done + self.batch_size]
+                    self.write_fn(batch)
+                    done += len(batch)
+            except Exception as e:
+                print(f"Scan writer: replay of {path} failed ({e}), will retry on next start")
+                # Keep only the rows that did not make it in
+                with open(claimed, 'w') as f:
+                    for row in rows[done:]:
+                        f.write(json.dumps(row) + '\n')
+                os.rename(claimed, path)
+                written += done
+                break
+            os.remove(claimed)
+            written += done
+        with self._cond:
+            self.replayed += written
+        if written:
+            print(f"Scan writer: replayed {written} spilled scans")
+        return written
+
+    def metrics(self):
+        with self._cond:
+            pending = len(self._rows) + self._in_flight
+        return {
+            "pending": pending,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "inline_writes": self.inline,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+        }
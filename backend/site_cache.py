@@ -0,0 +1,103 @@
+import json
+import time
+import hashlib
+import threading
+
+from sqlalchemy import event
+
+from models import PricingPlan, SiteSetting
+from rollups import bump_version, counter
+
+# cache name -> models whose writes invalidate it
+CACHED_TABLES = {
+    'plans': (PricingPlan,),
+    'settings': (SiteSetting,),
+}
+
+
+def version_counter(name):
+    return f"{name}_version"
+
+
+class CachedContent:
+    """One cached value with its JSON body, ETag and the version it was loaded at."""
+    __slots__ = ('value', 'body', 'etag', 'version')
+
+    def __init__(self, value, version):
+        self.value = value
+        self.body = json.dumps(value, separators=(',', ':'))
+        self.etag = hashlib.sha1(self.body.encode()).hexdigest()[:20]
+        self.version = version
+
+
+class SiteCache:
+    """Read-through cache for the small tables that only change from the admin panel.
+
+    `get(name, loader)` returns a CachedContent, calling `loader()` (the DB query) only
+    when nothing is cached or the `<name>_version` StatCounter moved. Every insert,
+    update or delete of a cached model bumps that counter in the same transaction (see
+    the listeners below), so other workers notice a change the next time they check the
+    counter, at most once per `check_interval` seconds; the worker that made the change
+    calls `invalidate()` after its commit and sees it immediately.
+    The ETag is a hash of the body, so every worker hands out the same one.
+    """
+
+    def __init__(self, check_interval=1.0, enabled=True):
+        self.check_interval = check_interval
+        self.enabled = enabled
+        self._entries = {} # name -> (CachedContent, checked_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry, checked_at = self._entries.get(name, (None, 0))
+            if self.enabled and entry is not None and now - checked_at < self.check_interval:
+                self.hits += 1
+                return entry
+        # Read the version before the rows: a write landing in between leaves a newer
+        # value under the older version, which only costs one extra reload
+        version = counter(version_counter(name))
+        if self.enabled and entry is not None and entry.version == version:
+            with self._lock:
+                self._entries[name] = (entry, now)
+                self.hits += 1
+            return entry
+        entry = CachedContent(loader(), version)
+        with self._lock:
+            self._entries[name] = (entry, now)
+            self.misses += 1
+        return entry
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def metrics(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "check_interval": self.check_interval,
+            }
+
+
+def _watch(name, model):
+    def changed(mapper, connection, target):
+        bump_version(connection, version_counter(name))
+    for kind in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, kind, changed)
+
+
+for _name, _models in CACHED_TABLES.items():
+    for _model in _models:
+        _watch(_name, _model)
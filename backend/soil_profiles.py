@@ -0,0 +1,110 @@
+import os
+import json
+import numpy as np
+
+PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "soil_profiles.json")
+DEFAULT_CLASS = "Yellow Soil"
+
+# Fields sampled per result from the profile's [min, max] range
+INT_RANGES = ("n", "p", "k", "moisture")
+FLOAT_RANGES = ("om", "ec")
+HEALTH_RANGE = (65, 98)
+
+
+class SoilProfileTable:
+    """All soil profiles, loaded once into per-class range arrays and static result templates."""
+
+    def __init__(self, path=PROFILES_PATH):
+        with open(path, encoding="utf-8") as f:
+            profiles = json.load(f)
+
+        self.classes = list(profiles)
+        self.index = {name: i for i, name in enumerate(self.classes)}
+        self.default_index = self.index[DEFAULT_CLASS]
+
+        # Shape (n_classes, 2) arrays of [min, max]
+        self.int_ranges = {key: np.array([profiles[c][key] for c in self.classes], dtype=np.int64) for key in INT_RANGES}
+        self.float_ranges = {key: np.array([profiles[c][key] for c in self.classes], dtype=np.float64) for key in FLOAT_RANGES}
+
+        # Everything that does not change between requests is formatted once here
+        self.templates = []
+        for c in self.classes:
+            p = profiles[c]
+            self.templates.append({
+                "soil_type": p["type"],
+                "texture": p["texture"],
+                "ph_min": p["ph"][0],
+                "ph_max": p["ph"][1],
+                "water_retention": p["water_retention"],
+                "cec": p["cec"],
+                "micro_nutrients": p["micro"],
+                "planting_season": p["season"],
+                "optimal_temp": f"{p['temp'][0]}°C - {p['temp'][1]}°C",
+                "drainage_type": p["drainage"],
+                "compaction_level": p["compaction"],
+                "climate_zone": p["climate"],
+                "possible_deficiencies": p["deficiencies"],
+                "recommended_fertilizer": p["fertilizer"],
+                "recommended_crops": p["crops"],
+            })
+
+    def generate(self, soil_types, confidences, rng=None):
+        """Build analysis dicts for a whole batch of (class name, confidence %) in one vectorized pass.
+
+        Unknown class names fall back to the Yellow Soil profile. Nested values (micro
+        nutrients, crop lists) are shared between results and must be treated as read-only.
+        """
+        rng = rng or np.random.default_rng()
+        idx = np.fromiter((self.index.get(s, self.default_index) for s in soil_types), dtype=np.int64, count=len(soil_types))
+        n = len(idx)
+
+        ints = {}
+        for key, table in self.int_ranges.items():
+            lo, hi = table[idx, 0], table[idx, 1]
+            ints[key] = rng.integers(lo, hi + 1).tolist()
+        floats = {}
+        for key, table in self.float_ranges.items():
+            floats[key] = rng.uniform(table[idx, 0], table[idx, 1]).tolist()
+        health = rng.integers(HEALTH_RANGE[0], HEALTH_RANGE[1] + 1, size=n).tolist()
+
+        results = []
+        for i, (t, conf) in enumerate(zip(idx.tolist(), confidences)):
+            tpl = self.templates[t]
+            # Same key order as the original per-request dict
+            results.append({
+                "confidence": f"{conf:.1f}%",
+                "soil_type": tpl["soil_type"],
+                "texture": tpl["texture"],
+                "ph_min": tpl["ph_min"],
+                "ph_max": tpl["ph_max"],
+                "nitrogen": f"{ints['n'][i]} mg/kg",
+                "phosphorus": f"{ints['p'][i]} mg/kg",
+                "potassium": f"{ints['k'][i]} mg/kg",
+                "organic_matter": f"{floats['om'][i]:.1f}%",
+                "moisture": f"{ints['moisture'][i]}%",
+                "water_retention": tpl["water_retention"],
+                "salinity_ec": f"{floats['ec'][i]:.2f} dS/m",
+                "cec": tpl["cec"],
+                "micro_nutrients": tpl["micro_nutrients"],
+                "planting_season": tpl["planting_season"],
+                "optimal_temp": tpl["optimal_temp"],
+                "drainage_type": tpl["drainage_type"],
+                "compaction_level": tpl["compaction_level"],
+                "climate_zone": tpl["climate_zone"],
+                "possible_deficiencies": tpl["possible_deficiencies"],
+                "recommended_fertilizer": tpl["recommended_fertilizer"],
+                "recommended_crops": tpl["recommended_crops"],
+                "health_score": f"{health[i]}/100",
+            })
+        return results
+
+
+profile_table = SoilProfileTable()
+
+
+def generate_stats(soil_types, confidences, rng=None):
+    return profile_table.generate(soil_types, confidences, rng)
+
+
+def get_soil_stats(soil_type, confidence):
+    return profile_table.generate([soil_type], [confidence])[0]
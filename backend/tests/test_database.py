@@ -0,0 +1,39 @@
+import os
+
+from sqlalchemy import create_engine, text
+
+from database import configure_engine, dispose_after_fork
+
+
+def test_forked_child_opens_its_own_connection(tmp_path):
+    engine = configure_engine(create_engine(f"sqlite:///{tmp_path / 'fork.db'}"))
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        conn.commit()
+        parent_conn = conn.connection.driver_connection
+    assert engine.pool.checkedin() == 1
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0: # child: report the connection it uses after disposing, then exit without cleanup
+        os.close(read_fd)
+        try:
+            dispose_after_fork(engine)
+            pooled = engine.pool.checkedin()
+            with engine.connect() as conn:
+                fresh = conn.connection.driver_connection is not parent_conn
+                conn.execute(text("INSERT INTO t VALUES (1)"))
+                conn.commit()
+            os.write(write_fd, f"{pooled} {int(fresh)}".encode())
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    os.waitpid(pid, 0)
+    with os.fdopen(read_fd) as f:
+        pooled, fresh = f.read().split()
+    assert pooled == "0" and fresh == "1"
+
+    # The parent's pooled connection was left open and still works
+    with engine.connect() as conn:
+        assert conn.connection.driver_connection is parent_conn
+        assert conn.execute(text("SELECT COUNT(*) FROM t")).scalar() == 1
@@ -0,0 +1,45 @@
+import numpy as np
+
+import dedup
+
+
+def brute_force_pairs(hashes, threshold):
+    hashes = [int(h) for h in hashes]
+    return {(i, j) for i in range(len(hashes)) for j in range(i + 1, len(hashes))
+            if bin(hashes[i] ^ hashes[j]).count('1') <= threshold}
+
+
+def collect(hashes, threshold):
+    pairs = set()
+    for i, j in dedup.near_duplicate_pairs(hashes, threshold):
+        pairs.update(zip(i.tolist(), j.tolist()))
+    return pairs
+
+
+def test_large_degenerate_bucket_is_compared_in_bounded_tiles(monkeypatch):
+    rng = np.random.default_rng(0)
+    # Most of the "dataset" hashes to 0 (blank photos), so it shares every band value
+    hashes = np.zeros(700, dtype=np.uint64)
+    hashes[::7] = rng.integers(0, 2 ** 63, size=100, dtype=np.uint64)
+    hashes[::11] = np.uint64(0b1011) # 3 bits from 0: near duplicates of the blanks
+    monkeypatch.setattr(dedup, 'COMPARE_CHUNK', 64)
+    shapes = []
+    real_popcount = dedup.popcount
+
+    def recording_popcount(x):
+        shapes.append(x.shape)
+        return real_popcount(x)
+
+    monkeypatch.setattr(dedup, 'popcount', recording_popcount)
+    assert collect(hashes, 4) == brute_force_pairs(hashes, 4)
+    assert max(rows * cols for rows, cols in shapes) <= 64 * 64
+
+
+def test_identical_hashes_form_one_group(tmp_path):
+    files = {f"c/{i}.png": {'class': 'c', 'size': i, 'sha256': f"{i:064x}", 'phash': f"{0:016x}"}
+             for i in range(50)}
+    files["c/other.png"] = {'class': 'c', 'size': 1, 'sha256': 'f' * 64, 'phash': 'ffffffffffffffff'}
+    kept, groups, report = dedup.deduplicate(str(tmp_path), files, threshold=4)
+    assert report['near_duplicate_groups'] == 1
+    assert report['images_in_near_groups'] == 50
+    assert "c/other.png" not in groups
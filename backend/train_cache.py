@@ -0,0 +1,218 @@
+"""
+Decode-once image cache for training and validation.
+
+  python train_cache.py [--size 416] [--workers 8]
+
+Decoding and resizing JPEGs dominates CPU training time, so every image in the
+dataset manifest (see dataset_builder.py) is decoded once, resized so its shorter
+side is `size` pixels (aspect ratio kept, nothing cropped, so the trainer's random
+crops still see the whole photo) and stored as uint8 RGB in one memory-mapped file:
+
+  DATASET_DIR/cache_<size>/images.u8    each image's h x w x 3 bytes, back to back
+  DATASET_DIR/cache_<size>/index.json   content hash -> (offset, h, w), plus label/split per image
+
+Entries are keyed by the image's SHA-256 from the manifest, so a rebuild only decodes
+images whose content is new and appends them; once images that left the dataset
+account for more than half the file it is compacted. Readers (the trainer below,
+export_model.py --from-cache) open the file read-only and the OS page cache shares
+it between dataloader worker processes.
+"""
+import os
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from preprocess import MODEL_INPUT_SIZE, load_image
+
+INDEX_VERSION = 2
+IMAGES_NAME = "images.u8"
+INDEX_NAME = "index.json"
+COPY_CHUNK = 64 * 1024 * 1024
+
+
+def cache_dir_for(dataset_dir, size=MODEL_INPUT_SIZE):
+    return os.path.join(dataset_dir, f"cache_{size}")
+
+
+def decode(path, size):
+    """RGB array with the shorter side resized to exactly `size` pixels, aspect ratio kept."""
+    with open(path, 'rb') as f:
+        img = load_image(f, size)
+    w, h = img.size
+    if min(w, h) != size: # load_image only ever shrinks
+        scale = size / min(w, h)
+        img = img.resize((max(size, round(w * scale)), max(size, round(h * scale))), Image.BILINEAR)
+    return np.asarray(img, dtype=np.uint8)
+
+
+def _nbytes(location):
+    _, h, w = location
+    return h * w * 3
+
+
+class TrainCache:
+    """Read side of the cache: the image bytes plus the per-image index."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, INDEX_NAME)) as f:
+            self.index = json.load(f)
+        self.size = self.index['size']
+        self.classes = self.index['classes']
+        path = os.path.join(cache_dir, IMAGES_NAME)
+        self.images = (np.memmap(path, dtype=np.uint8, mode='r') if os.path.getsize(path)
+                       else np.zeros(0, dtype=np.uint8))
+        self.slots = {rel: e['slot'] for rel, e in self.index['samples'].items()}
+
+    def samples(self, split):
+        """[(relative path, class name, slot)] for one split, in path order; a slot is [offset, h, w]."""
+        return sorted((rel, e['class'], e['slot']) for rel, e in self.index['samples'].items() if e['split'] == split)
+
+    def array(self, slot):
+        offset, h, w = slot
+        return self.images[offset:offset + h * w * 3].reshape(h, w, 3)
+
+    def image(self, slot):
+        return Image.fromarray(np.array(self.array(slot)))
+
+
+def _load_index(cache_dir, size):
+    try:
+        with open(os.path.join(cache_dir, INDEX_NAME)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != INDEX_VERSION or index.get('size') != size:
+        return None
+    if not os.path.exists(os.path.join(cache_dir, IMAGES_NAME)):
+        return None
+    return index
+
+
+def _save_index(cache_dir, index):
+    path = os.path.join(cache_dir, INDEX_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f)
+    os.replace(path + '.tmp', path)
+
+
+def _compact(path, keep):
+    """Rewrite the image file with only the `keep` entries; returns their new locations."""
+    moved = {}
+    with open(path, 'rb') as src, open(path + '.tmp', 'wb') as dst:
+        for sha, (offset, h, w) in sorted(keep.items(), key=lambda item: item[1][0]):
+            moved[sha] = [dst.tell(), h, w]
+            src.seek(offset)
+            remaining = h * w * 3
+            while remaining:
+                chunk = src.read(min(remaining, COPY_CHUNK))
+                dst.write(chunk)
+                remaining -= len(chunk)
+    os.replace(path + '.tmp', path)
+    return moved
+
+
+def build_cache(manifest, cache_dir, size=MODEL_INPUT_SIZE, workers=None):
+    """Bring the cache at cache_dir in line with a dataset manifest; returns a summary dict."""
+    os.makedirs(cache_dir, exist_ok=True)
+    raw_dir = manifest['raw_dir']
+    files = {rel: e for rel, e in manifest['files'].items() if e.get('split')} # duplicates are not trained on
+    index = _load_index(cache_dir, size) or {'version': INDEX_VERSION, 'size': size, 'slots': {}}
+    path = os.path.join(cache_dir, IMAGES_NAME)
+    if not index['slots']:
+        open(path, 'wb').close()
+
+    source = {} # sha256 -> one raw file with that content
+    for rel, entry in sorted(files.items()):
+        source.setdefault(entry['sha256'], rel)
+    keep = {sha: slot for sha, slot in index['slots'].items() if sha in source}
+    todo = [sha for sha in source if sha not in keep]
+
+    # Drop entries that left the dataset from the index first, so a crash while the
+    # file is rewritten never leaves the index pointing at the wrong bytes
+    index.update(slots=keep, samples={}, classes=[])
+    _save_index(cache_dir, index)
+    compacted = False
+    live = sum(_nbytes(slot) for slot in keep.values())
+    if os.path.getsize(path) > 2 * live:
+        index['slots'] = {}
+        _save_index(cache_dir, index)
+        keep = _compact(path, keep)
+        compacted = True
+
+    failed = []
+    if todo:
+        # Pillow releases the GIL while decoding and resizing, so threads use every core;
+        # results are appended in order by this thread
+        def load(sha):
+            try:
+                return decode(os.path.join(raw_dir, source[sha]), size)
+            except (OSError, ValueError) as e:
+                print(f"Skipping {source[sha]}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 4) as pool, open(path, 'r+b') as f:
+            f.seek(0, os.SEEK_END)
+            for sha, pixels in zip(todo, pool.map(load, todo)):
+                if pixels is None:
+                    failed.append(source[sha])
+                    continue
+                h, w, _ = pixels.shape
+                keep[sha] = [f.tell(), h, w]
+                f.write(np.ascontiguousarray(pixels).tobytes())
+
+    index.update(
+        slots=keep,
+        classes=sorted({e['class'] for e in files.values()}),
+        samples={rel: {'sha256': e['sha256'], 'class': e['class'], 'split': e['split'], 'slot': keep[e['sha256']]}
+                 for rel, e in files.items() if e['sha256'] in keep},
+    )
+    _save_index(cache_dir, index)
+    return {'images': len(index['samples']), 'decoded': len(todo) - len(failed), 'failed': len(failed),
+            'entries': len(keep), 'compacted': compacted, 'bytes': os.path.getsize(path)}
+
+
+def cached_trainer(cache, base=None):
+    """ultralytics ClassificationTrainer (or subclass `base`) whose datasets read pixels from `cache` instead of decoding files.
+
+    The dataset folder is still scanned for the sample list and class indices, so
+    everything else (augmentation, class order, validation) is unchanged.
+    """
+    from ultralytics.data.dataset import ClassificationDataset
+    from ultralytics.models.yolo.classify import ClassificationTrainer
+
+    class CachedClassificationDataset(ClassificationDataset):
+        def __init__(self, root, args, augment=False, prefix=""):
+            super().__init__(root, args, augment=augment, prefix=prefix)
+            # dataset/<split>/<class>/<file> -> manifest key <class>/<file>
+            self.slots = [cache.slots.get(os.path.relpath(s[0], root).replace(os.sep, '/')) for s in self.samples]
+
+        def __getitem__(self, i):
+            slot = self.slots[i]
+            if slot is None: # not in the cache (e.g. added after it was built); decode as usual
+                return super().__getitem__(i)
+            return {"img": self.torch_transforms(cache.image(slot)), "cls": self.samples[i][1]}
+
+    class CachedClassificationTrainer(base or ClassificationTrainer):
+        def build_dataset(self, img_path, mode="train", batch=None):
+            return CachedClassificationDataset(root=img_path, args=self.args, augment=mode == "train", prefix=mode)
+
+    return CachedClassificationTrainer
+
+
+if __name__ == "__main__":
+    from dataset_builder import load_manifest
+    from train_model import DATASET_DIR
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset-dir", default=DATASET_DIR)
+    parser.add_argument("--size", type=int, default=MODEL_INPUT_SIZE)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+    manifest = load_manifest(args.dataset_dir)
+    if manifest is None:
+        raise SystemExit(f"No dataset manifest in {args.dataset_dir}; run dataset_builder.py first.")
+    print(build_cache(manifest, cache_dir_for(args.dataset_dir, args.size), args.size, args.workers))
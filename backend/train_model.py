@@ -1,79 +1,146 @@
 import os
+import json
 import shutil
-import random
+import argparse
 from ultralytics import YOLO
+from dataset_builder import build_dataset, load_manifest, LINK_MODES
+from train_cache import TrainCache, build_cache, cache_dir_for, cached_trainer
 
 # Paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 RAW_DATA_DIR = os.path.join(os.path.dirname(BASE_DIR), "temp_data", "Soil types")
 DATASET_DIR = os.path.join(BASE_DIR, "dataset")
+IMGSZ = 416
 
-def prepare_dataset():
-    if os.path.exists(DATASET_DIR):
-        shutil.rmtree(DATASET_DIR)
-    
-    os.makedirs(os.path.join(DATASET_DIR, "train"), exist_ok=True)
-    os.makedirs(os.path.join(DATASET_DIR, "val"), exist_ok=True)
-    
-    classes = os.listdir(RAW_DATA_DIR)
-    print(f"Detected classes: {classes}")
-    
-    for cls in classes:
-        cls_path = os.path.join(RAW_DATA_DIR, cls)
-        if not os.path.isdir(cls_path):
-            continue
-            
-        images = [f for f in os.listdir(cls_path) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        random.shuffle(images)
-        
-        split = int(0.8 * len(images))
-        train_imgs = images[:split]
-        val_imgs = images[split:]
-        
-        # Create class folders in train/val
-        os.makedirs(os.path.join(DATASET_DIR, "train", cls), exist_ok=True)
-        os.makedirs(os.path.join(DATASET_DIR, "val", cls), exist_ok=True)
-        
-        for img in train_imgs:
-            shutil.copy(os.path.join(cls_path, img), os.path.join(DATASET_DIR, "train", cls, img))
-        for img in val_imgs:
-            shutil.copy(os.path.join(cls_path, img), os.path.join(DATASET_DIR, "val", cls, img))
-            
-    print("Dataset prepared successfully.")
+def prepare_dataset(seed=0, val_fraction=0.2, link='hardlink', dedup=True, drop_near=False):
+    # Incremental: links new/changed images into train/val instead of recopying everything
+    summary = build_dataset(RAW_DATA_DIR, DATASET_DIR, seed=seed, val_fraction=val_fraction, link=link,
+                            dedup=dedup, drop_near=drop_near)
+    print(f"Dataset prepared: {summary['train']} train / {summary['val']} val images in {summary['classes']} classes "
+          f"({summary['hashed']} hashed, {summary['linked']} linked, {summary['removed']} removed)")
+    if 'dedup' in summary:
+        d = summary['dedup']
+        print(f"Dedup: {d['exact_duplicates_removed']} exact duplicates removed, {d['near_duplicate_groups']} near-duplicate "
+              f"groups ({d['images_in_near_groups']} images, {d['near_duplicates_removed']} removed), "
+              f"{d['label_conflicts']} filed under more than one class")
+    return summary
 
-def train():
-    print("Starting Advanced AI Model Training (High Intensity)...")
-    # Using 's' (Small) instead of 'n' (Nano) for much better feature extraction
-    model = YOLO("yolov8s-cls.pt") 
-    
-    # Advanced Training Parameters
-    # imgsz=416: Higher resolution for better texture detection
-    # epochs=50: More training cycles
-    # patience=10: Early stopping if no improvement for 10 epochs
-    # dropout=0.1: Prevent overfitting
-    results = model.train(
-        data=DATASET_DIR, 
-        epochs=50, 
-        imgsz=416,
-        batch=16,
-        patience=10,
-        dropout=0.1,
-        project=os.path.join(BASE_DIR, "runs"),
-        name="soil_classifier_v2"
-    )
-    
-    # Export the best model to a final location
-    best_model_path = os.path.join(BASE_DIR, "runs", "soil_classifier_v2", "weights", "best.pt")
-    final_model_path = os.path.join(BASE_DIR, "soil_model_v2.pt")
-    shutil.copy(best_model_path, final_model_path)
-    
-    # Update current system to use the new best model
+def prepare_cache(size=IMGSZ):
+    # Decodes only images whose content is not cached yet (see train_cache.py)
+    cache_dir = cache_dir_for(DATASET_DIR, size)
+    summary = build_cache(load_manifest(DATASET_DIR), cache_dir, size)
+    print(f"Image cache ready: {summary['images']} images, {summary['decoded']} decoded, "
+          f"{summary['bytes'] / 1024 ** 2:.0f} MB at {cache_dir}")
+    return TrainCache(cache_dir)
+
+# Training profiles; any field can be overridden from the command line.
+#   workers: dataloader processes    cache: 'mmap' (train_cache.py), 'ram'/'disk' (ultralytics) or False
+#   stages: (imgsz, share of epochs) run in order, each starting from the previous stage's best
+#           weights; the last stage is at the serving size so preprocessing stays consistent
+TRAINING_PROFILES = {
+    # The original run: small model at full resolution, sized for a GPU
+    'full': {"model": "yolov8s-cls.pt", "epochs": 50, "batch": 16, "patience": 10, "workers": 8,
+             "cache": 'mmap', "stages": ((IMGSZ, 1.0),), "device": None},
+    # GPU-less hosts: nano model, most epochs at low resolution, every core feeding the loader
+    'cpu': {"model": "yolov8n-cls.pt", "epochs": 30, "batch": 32, "patience": 8, "workers": os.cpu_count() or 4,
+            "cache": 'mmap', "stages": ((224, 0.7), (IMGSZ, 0.3)), "device": 'cpu'},
+    # End-to-end check of the pipeline in a few minutes
+    'quick': {"model": "yolov8n-cls.pt", "epochs": 2, "batch": 32, "patience": 2, "workers": os.cpu_count() or 4,
+              "cache": 'mmap', "stages": ((224, 0.5), (IMGSZ, 0.5)), "device": 'cpu'},
+}
+
+def promote(model_path):
+    # Update current system to use the new best model. Copy next to the target and
+    # rename so running servers' model watchers never see a half-written file.
     prod_model_path = os.path.join(BASE_DIR, "soil_model.pt")
-    shutil.copy(final_model_path, prod_model_path)
-    
-    print(f"✅ Enhanced Model trained and saved as {prod_model_path}")
+    tmp_model_path = prod_model_path + ".tmp"
+    shutil.copy(model_path, tmp_model_path)
+    os.replace(tmp_model_path, prod_model_path)
+    return prod_model_path
+
+def train(profile='full', distill_from=None, temperature=4.0, alpha=0.7, **overrides):
+    """Train with a TRAINING_PROFILES entry; with distill_from, a student learns from that model too.
+
+    Returns the path of the best weights.
+    """
+    settings = dict(TRAINING_PROFILES[profile], **{k: v for k, v in overrides.items() if v is not None})
+    print(f"Starting AI Model Training (profile '{profile}'{', distilling from ' + distill_from if distill_from else ''})...")
+    print(f"  {settings}")
+    name = "soil_student" if distill_from else "soil_classifier_v2"
+
+    # dropout=0.1: Prevent overfitting
+    # patience: Early stopping if no improvement for that many epochs
+    weights = settings["model"]
+    stages = settings["stages"]
+    for i, (size, share) in enumerate(stages):
+        trainer = None
+        cache = settings["cache"]
+        if cache == 'mmap':
+            # Epochs read pre-resized pixels instead of decoding JPEGs
+            trainer = cached_trainer(prepare_cache(size))
+            cache = False
+        if distill_from:
+            from ultralytics.models.yolo.classify import ClassificationTrainer
+            from distill import distillation_trainer
+            trainer = distillation_trainer(distill_from, trainer or ClassificationTrainer, temperature, alpha)
+        model = YOLO(weights)
+        model.train(
+            data=DATASET_DIR,
+            epochs=max(1, round(settings["epochs"] * share)),
+            imgsz=size,
+            batch=settings["batch"],
+            patience=settings["patience"],
+            workers=settings["workers"],
+            cache=cache,
+            dropout=0.1,
+            project=os.path.join(BASE_DIR, "runs"),
+            name=name if len(stages) == 1 else f"{name}_{size}",
+            trainer=trainer,
+            **({"device": settings["device"]} if settings["device"] else {})
+        )
+        weights = str(model.trainer.best)
+        print(f"Stage {i + 1}/{len(stages)} at imgsz={size} done: {weights}")
+    return weights
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", type=int, default=0, help="split seed; same seed and images give the same split")
+    parser.add_argument("--link", choices=LINK_MODES, default='hardlink')
+    parser.add_argument("--prepare-only", action="store_true")
+    parser.add_argument("--no-dedup", action="store_true", help="keep duplicate images (they may leak across the split)")
+    parser.add_argument("--drop-near-duplicates", action="store_true")
+    parser.add_argument("--no-cache", action="store_true", help="decode images from disk every epoch")
+    parser.add_argument("--profile", choices=TRAINING_PROFILES, default=os.environ.get('SOIL_AI_TRAIN_PROFILE', 'full'))
+    parser.add_argument("--model", help="starting weights, overrides the profile")
+    parser.add_argument("--epochs", type=int)
+    parser.add_argument("--batch", type=int)
+    parser.add_argument("--workers", type=int, help="dataloader worker processes")
+    parser.add_argument("--distill", nargs='?', const=os.path.join(BASE_DIR, "soil_model.pt"), metavar="TEACHER",
+                        help="train a nano student from TEACHER (default soil_model.pt) and report teacher vs student")
+    parser.add_argument("--temperature", type=float, default=4.0)
+    parser.add_argument("--alpha", type=float, default=0.7, help="weight of the teacher term in the distillation loss")
+    parser.add_argument("--promote", action="store_true", help="install a distilled student as soil_model.pt")
+    args = parser.parse_args()
     # Ensure data is fresh
-    prepare_dataset()
-    train()
+    prepare_dataset(seed=args.seed, link=args.link, dedup=not args.no_dedup, drop_near=args.drop_near_duplicates)
+    if not args.prepare_only:
+        model = args.model or ("yolov8n-cls.pt" if args.distill else None)
+        best = train(args.profile, distill_from=args.distill, temperature=args.temperature, alpha=args.alpha,
+                     model=model, epochs=args.epochs, batch=args.batch, workers=args.workers,
+                     cache=False if args.no_cache else None)
+        if args.distill:
+            from distill import compare, print_report
+            final_model_path = os.path.join(BASE_DIR, "soil_model_student.pt")
+            shutil.copy(best, final_model_path)
+            report = compare(args.distill, final_model_path)
+            print_report(report)
+            with open(os.path.join(BASE_DIR, "runs", "distill_report.json"), 'w') as f:
+                json.dump(report, f, indent=2)
+        else:
+            # Export the best model to a final location
+            final_model_path = os.path.join(BASE_DIR, "soil_model_v2.pt")
+            shutil.copy(best, final_model_path)
+        if args.distill and not args.promote:
+            print(f"Student saved as {final_model_path}; pass --promote to serve it")
+        else:
+            print(f"✅ Model trained and saved as {promote(final_model_path)}")
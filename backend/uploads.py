@@ -0,0 +1,87 @@
+import os
+import hashlib
+import tempfile
+
+MAX_UPLOAD_BYTES = int(float(os.environ.get('SOIL_AI_MAX_UPLOAD_MB', 20)) * 1024 * 1024)
+# Uploads larger than this are spooled to a temp file instead of being kept in memory
+SPOOL_MAX_MEMORY = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of the image formats we accept; keep in line with IMAGE_EXTENSIONS in app.py
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+)
+SNIFF_BYTES = 8
+
+
+class UploadError(Exception):
+    def __init__(self, detail, status_code=400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+def sniff_image_type(header):
+    for signature, kind in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return kind
+    return None
+
+
+class Upload:
+    """A validated upload: a binary file object positioned at 0 plus its SHA-256."""
+
+    def __init__(self, file, digest, size, kind, owned):
+        self.file = file
+        self.digest = digest
+        self.size = size
+        self.kind = kind
+        self._owned = owned
+
+    def close(self):
+        if self._owned:
+            self.file.close()
+
+
+def spool_upload(stream, max_bytes=MAX_UPLOAD_BYTES):
+    """Validate and hash an upload without ever holding all of it in memory.
+
+    The first bytes are sniffed before anything else is read so non-images are rejected
+    cheaply. Seekable streams (the framework's own spooled files) are hashed in place;
+    anything else is copied into a SpooledTemporaryFile that moves to disk past 1 MB.
+    Raises UploadError: 415 for non-images, 413 once `max_bytes` is exceeded.
+    """
+    seekable = getattr(stream, 'seekable', lambda: False)()
+    start = stream.tell() if seekable else 0
+    header = stream.read(SNIFF_BYTES)
+    kind = sniff_image_type(header)
+    if kind is None:
+        raise UploadError("Unsupported file type, please upload a JPG or PNG image", 415)
+
+    target = None if seekable else tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    h = hashlib.sha256(header)
+    size = len(header)
+    if target is not None:
+        target.write(header)
+    try:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadError(f"Image too large (max {max_bytes // (1024 * 1024)} MB)", 413)
+            h.update(chunk)
+            if target is not None:
+                target.write(chunk)
+    except Exception:
+        if target is not None:
+            target.close()
+        raise
+
+    if target is None:
+        stream.seek(start)
+        return Upload(stream, h.hexdigest(), size, kind, owned=False)
+    target.seek(0)
+    return Upload(target, h.hexdigest(), size, kind, owned=True)
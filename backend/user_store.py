@@ -0,0 +1,126 @@
+import os
+import json
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    username   TEXT NOT NULL UNIQUE,
+    email      TEXT NOT NULL,
+    password   TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS users_email ON users (email);
+"""
+
+# Stores created before users had a stable numeric id (username was the primary key)
+ADD_ID = """
+CREATE TABLE users_new (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    username   TEXT NOT NULL UNIQUE,
+    email      TEXT NOT NULL,
+    password   TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+INSERT INTO users_new (username, email, password, created_at)
+    SELECT username, email, password, created_at FROM users ORDER BY rowid;
+DROP TABLE users;
+ALTER TABLE users_new RENAME TO users;
+"""
+COLUMNS = "id, username, email, password, created_at"
+
+
+class UserExists(Exception):
+    def __init__(self, field):
+        super().__init__(f"{field} already exists")
+        self.field = field
+
+
+class UserStore:
+    """SQLite-backed user store for the FastAPI server (replaces users.json).
+
+    Lookups by username (primary key) and email (unique index) are O(log N), every
+    write is a single atomic transaction, and WAL mode lets readers proceed while a
+    writer commits. Each thread gets its own connection. `on_change(username)` is called
+    after a password change or deletion, e.g. to invalidate cached identities.
+    """
+
+    def __init__(self, path, on_change=None):
+        self.path = path
+        self.on_change = on_change
+        self._local = threading.local()
+        conn = self._connect()
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+        if columns and "id" not in columns:
+            conn.executescript("BEGIN IMMEDIATE;" + ADD_ID + "COMMIT;")
+        conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _one(self, sql, args):
+        row = self._connect().execute(sql, args).fetchone()
+        return dict(row) if row else None
+
+    def get(self, username):
+        return self._one(f"SELECT {COLUMNS} FROM users WHERE username = ?", (username,))
+
+    def get_by_email(self, email):
+        return self._one(f"SELECT {COLUMNS} FROM users WHERE email = ?", (email,))
+
+    def create(self, username, email, password, created_at):
+        """Insert a user; raises UserExists('Username' / 'Email') on a uniqueness conflict."""
+        try:
+            self._connect().execute(
+                "INSERT INTO users (username, email, password, created_at) VALUES (?, ?, ?, ?)",
+                (username, email, password, created_at),
+            )
+        except sqlite3.IntegrityError as e:
+            raise UserExists("Email" if "email" in str(e) else "Username")
+
+    def update_password(self, username, password, notify=True):
+        """Store a new hash; notify=False for a rehash of the same password, which changes no identity."""
+        cur = self._connect().execute("UPDATE users SET password = ? WHERE username = ?", (password, username))
+        return self._changed(username, cur.rowcount > 0 and notify)
+
+    def delete(self, username):
+        cur = self._connect().execute("DELETE FROM users WHERE username = ?", (username,))
+        return self._changed(username, cur.rowcount > 0)
+
+    def _changed(self, username, changed):
+        if changed and self.on_change is not None:
+            self.on_change(username)
+        return changed
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def migrate_from_json(self, json_path):
+        """One-shot import of the legacy users.json; returns how many users were inserted and renames the file."""
+        if not os.path.exists(json_path):
+            return 0
+        with open(json_path) as f:
+            users = json.load(f)
+        rows = [(u["username"], u["email"], u["password"], u.get("created_at", "")) for u in users.values()]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # OR IGNORE keeps the import idempotent if it is interrupted and re-run
+            cur = conn.executemany("INSERT OR IGNORE INTO users (username, email, password, created_at) VALUES (?, ?, ?, ?)", rows)
+            inserted = cur.rowcount # summed over the rows; ignored ones (username/email taken) count 0
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        os.replace(json_path, json_path + ".migrated")
+        print(f"Migrated {inserted} users from {json_path} to {self.path}"
+              + (f" ({len(rows) - inserted} skipped, username or email already present)" if inserted < len(rows) else ""))
+        return inserted